@@ -0,0 +1,65 @@
+# Compare the event schedulers in `simlib/scheduler.py` on the nudge and omission workloads.
+#
+# Each workload is run once with each scheduler, from the same random seed. Because every scheduler pops events in
+#  the same order, the runs do exactly the same work, and the only difference is the time spent in the scheduler.
+#
+#   python3 bench/scheduler_bench.py --max-t 100000
+import argparse
+import os
+import random
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "nudge"))
+sys.path.insert(0, os.path.join(root, "omission"))
+
+import nudge
+import omission
+from simlib.scheduler import schedulers
+from simlib.sink import ResultSink
+
+# Simulated seconds for the untimed warm-up runs
+warm_up_t = 100.0
+
+# One FCFS nudge simulation at rho=0.8, as in `nudge.run_sims`
+def nudge_workload(max_t, scheduler, out):
+    with ResultSink(out, ["t", "service_time", "q_time", "name"]) as sink:
+        queue = nudge.FCFSQueue()
+        server = nudge.Server(queue, sink.table(name="%s_%.2f"%(queue.name(), 0.8)))
+        client = nudge.Client(0.8, server)
+        nudge.sim_loop(max_t, client, scheduler)
+
+# The omission rho sweep, as in `omission.weibull_rho_sweep`
+def omission_workload(max_t, scheduler_type, out):
+    with omission.make_sink(out) as sink:
+        for client in omission.weibull_rho_sweep():
+            client.server.record_to(sink)
+            omission.sim_loop(max_t, client, scheduler_type())
+            sink.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the event schedulers on the nudge and omission workloads")
+    parser.add_argument("--max-t", type=float, default=100000.0, help="Simulated seconds per run")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print("workload,scheduler,max_t,seconds")
+    with open(os.devnull, "w") as out:
+        for workload_name, workload in [
+                ("nudge_fcfs", lambda max_t, scheduler_type: nudge_workload(max_t, scheduler_type(), out)),
+                ("omission_rho_sweep", lambda max_t, scheduler_type: omission_workload(max_t, scheduler_type, out))]:
+            # An untimed warm-up run, so that lazy imports (like numpy in `Streams.numpy`) and other one-off costs
+            #  aren't charged to whichever scheduler happens to be timed first
+            for scheduler_type in schedulers.values():
+                random.seed(args.seed)
+                workload(min(args.max_t, warm_up_t), scheduler_type)
+            for scheduler_name, scheduler_type in schedulers.items():
+                random.seed(args.seed)
+                start = time.perf_counter()
+                workload(args.max_t, scheduler_type)
+                print("%s,%s,%f,%f"%(workload_name, scheduler_name, args.max_t, time.perf_counter() - start))
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,119 @@
 # Small simulator to demonstrate the effects of "cold starting" a system with a cache, and a backend
 #  that can't handle the entire offered load.
-from collections import OrderedDict
-from numpy import random
+import math
+import os
+import sys
+from array import array
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simlib import cli
+from simlib.rng import Streams
+from simlib.trace import TraceSource
+from policies import ARCCache, ClockCache, LFUCache, S3FIFOCache, WTinyLFUCache
 
 # LRU models a simple least-recently-used cache.
 # Puts evict the item from the cache that has been used (get or put) least recently.
+#
+# The recency list is a doubly-linked list threaded through preallocated arrays of slot indexes, with `map` taking
+#  each key to its slot. Slot `capacity` is a sentinel: `next` of the sentinel is the most recently used slot, and
+#  `prev` of the sentinel is the least recently used. Every operation is O(1), and each cached key costs a dict entry
+#  plus 16 bytes of arrays, so caches with tens of millions of integer keys are practical.
 class LRU(object):
     def __init__(self, capacity):
         self.capacity = capacity
-        self.map = OrderedDict()
+        sentinel = capacity
         # Here we prime the cache with the items that we know are going to be the most popular (see the Zipf
         #  distribution below). This simulates starting time with a perfectly full cache.
-        for i in range(capacity):
-            self.map[i+1] = True
+        # Slot `i` holds key `i+1`, with key 1 least and key `capacity` most recently used, just as if they had been
+        #  put in that order.
+        self.keys = array('q', range(1, capacity + 1))
+        self.map = dict(zip(self.keys, range(capacity)))
+        self.next = array('i', range(-1, capacity))
+        self.prev = array('i', range(1, capacity + 2))
+        self.next[0] = sentinel
+        self.prev[sentinel] = 0 if capacity > 0 else sentinel
+        # Slots that don't hold a key
+        self.free = array('i')
+
+    def _unlink(self, s):
+        p = self.prev[s]
+        n = self.next[s]
+        self.next[p] = n
+        self.prev[n] = p
+
+    # Make slot `s` the most recently used
+    def _push_front(self, s):
+        sentinel = self.capacity
+        head = self.next[sentinel]
+        self.next[sentinel] = s
+        self.prev[s] = sentinel
+        self.next[s] = head
+        self.prev[head] = s
+
+    def _evict(self):
+        s = self.prev[self.capacity]
+        self._unlink(s)
+        del self.map[self.keys[s]]
+        self.free.append(s)
 
     # Put the `v` into the cache for key `k`.
     def put(self, k, v):
-        if k in self.map:
-            v = self.map.pop(k)
+        s = self.map.get(k)
+        if s is not None:
+            self._unlink(s)
+            self._push_front(s)
+            return True
         if len(self.map) == self.capacity:
-            self.map.popitem(last=False)
+            self._evict()
         if v is not None:
-            self.map[k] = v
+            s = self.free.pop()
+            self.keys[s] = k
+            self.map[k] = s
+            self._push_front(s)
         return v
 
     # Return `true` if `k` is in the cache
+    # Like a put of `None`, looking up a key that isn't cached evicts the least recently used key if the cache is full.
     def is_cached(self, k):
         return self.put(k, None) is not None
 
     # Remove all items from the cache
     def flush(self):
-        self.map = OrderedDict()
+        sentinel = self.capacity
+        self.map = {}
+        self.next[sentinel] = sentinel
+        self.prev[sentinel] = sentinel
+        self.free = array('i', range(self.capacity))
 
 # Stats is a convenience class that keeps track of hits and misses, and prints them out once a second.
+# Results are added a block of requests at a time, and bucketed into seconds in bulk with numpy.
 class Stats(object):
     def __init__(self,name):
-        self.last_print = 0
+        self.second = 0
         self.hits = 0
         self.misses = 0
         self.name = name
 
-    def add_stats(self, t, is_hit):
-        if t - self.last_print > 1.0: 
-            print("%f,%d,%d,%f,%s"%(t, self.hits, self.misses, self.hits/float(self.hits+self.misses), self.name))
-            self.hits, self.misses, self.last_print = (0, 0, t)
-        if is_hit:
-            self.hits += 1
-        else:
-            self.misses += 1
+    # Add a block of requests, made at the (increasing) times in the array `times`, where `hits` is an array that's 1
+    #  for each cache hit and 0 for each miss. Second `s` counts the requests in (s, s + 1].
+    def add_stats(self, times, hits):
+        seconds = numpy.ceil(times).astype(numpy.int64) - 1
+        first = int(seconds[0])
+        requests_per_second = numpy.bincount(seconds - first)
+        hits_per_second = numpy.bincount(seconds - first, weights=hits)
+        for i in numpy.flatnonzero(requests_per_second).tolist():
+            if first + i != self.second:
+                self.print_stats()
+                self.second = first + i
+            self.hits += int(hits_per_second[i])
+            self.misses += int(requests_per_second[i] - hits_per_second[i])
+
+    # Print out the stats for the current second, and start counting again
+    def print_stats(self):
+        if self.hits + self.misses > 0:
+            print("%f,%d,%d,%f,%s"%(self.second + 1, self.hits, self.misses, self.hits/float(self.hits+self.misses), self.name))
+        self.hits, self.misses = (0, 0)
 
 # Backend simulates a backend service (e.g. a database) that can only respond to `max_per_second` requests.
 #  Because we don't care about the sub-second distribution, we brute force this by just counting the number
@@ -72,33 +138,100 @@ class Backend(object):
 #  `cache_size` is the number of objects we keep in cache
 #  `arrival_rate` is the number of requests arriving each second
 #  `backend_max_rate` is the maximum number of requests per second the backend can handle (see Backend class)
+#  `policy` is the type of cache to use, `LRU` or one of the policies in `policies.py`
+#  `streams` is where the keys are drawn from (see `simlib/rng.py`). By default, it's seeded from the global RNG.
+#  `trace` is a trace file (see `simlib/trace.py`) with a `key` column to replay instead of drawing keys from the zipf
+#    distribution. The simulation stops early if the trace runs out.
 #
-# We loop for 60 simulated seconds, selecting keys from a zipf distribution, and checking if they are in the cache.
+# We loop for `max_t` (by default 60) simulated seconds, selecting keys from a zipf distribution, and checking if they
+#  are in the cache.
 # If the keys aren't in the cache, we try fetch them from the backend.
 # After 3 seconds of simulated time, we flush the cache, demonstrating the cold start.
-def run_sim(zipf_alpha, cache_size, arrival_rate, backend_max_rate, name):
-    lru = LRU(cache_size)
+#
+# Requests arrive exactly `1 / arrival_rate` apart, so request times and keys are drawn in blocks of `block_size` with
+#  numpy, rather than one call per request. Only the cache and backend logic runs per request.
+def run_sim(zipf_alpha, cache_size, arrival_rate, backend_max_rate, name, max_t=60.0, block_size=65536, policy=None, streams=None, trace=None):
+    keys_rng = (streams or Streams()).numpy("keys")
+    key_blocks = TraceSource(trace, ["key"], dtype="<i8").chunks(block_size) if trace is not None else None
+    cache = (policy or LRU)(cache_size)
     stats = Stats(name)
     backend = Backend(backend_max_rate)
-    time = 0.0
-    flushed = False
-
-    while time < 60.0:
-        time += 1 / arrival_rate
-        key = random.zipf(zipf_alpha)
-        if lru.is_cached(key):
-            stats.add_stats(time, True)
+    n_requests = int(math.ceil(max_t * arrival_rate))
+    # The index of the request after which we flush the cache
+    flush_i = int(math.ceil(4.0 * arrival_rate)) - 1
+
+    for start in range(0, n_requests, block_size):
+        end = min(start + block_size, n_requests)
+        if key_blocks is None:
+            keys = keys_rng.zipf(zipf_alpha, end - start).tolist()
+        else:
+            block = next(key_blocks, None)
+            if block is None:
+                break
+            keys = block[0][:end - start]
+            end = start + len(keys)
+        times = numpy.arange(start + 1, end + 1) / arrival_rate
+        hits = bytearray(end - start)
+        if start <= flush_i < end:
+            serve(cache, backend, times, keys, hits, 0, flush_i - start + 1)
+            cache.flush()
+            serve(cache, backend, times, keys, hits, flush_i - start + 1, end - start)
         else:
-            stats.add_stats(time, False)
-            if backend.get(time):
-                lru.put(key, True)
-        
-        if time >= 4.0 and not flushed:
-            flushed = True
-            lru.flush()
-        
-print("time,hits,misses,rate,name")
-run_sim(1.3, 1000, 1000.0, 5.0, "backend_0.5%")
-run_sim(1.3, 1000, 1000.0, 10.0, "backend_1%")
-run_sim(1.3, 1000, 1000.0, 20.0, "backend_2%")
-run_sim(1.3, 1000, 1000.0, 100.0, "backend_10%")
\ No newline at end of file
+            serve(cache, backend, times, keys, hits, 0, end - start)
+        stats.add_stats(times, numpy.frombuffer(hits, dtype=numpy.uint8))
+    stats.print_stats()
+
+# Serve requests `start` to `end` of a block, setting `hits[i]` for each one that's a cache hit
+def serve(cache, backend, times, keys, hits, start, end):
+    times = times[start:end].tolist()
+    for i in range(start, end):
+        key = keys[i]
+        if cache.is_cached(key):
+            hits[i] = 1
+        elif backend.get(times[i - start]):
+            cache.put(key, True)
+
+# Cache policies that can be picked by name
+policies = {
+    "lru": LRU,
+    "clock": ClockCache,
+    "lfu": LFUCache,
+    "arc": ARCCache,
+    "s3fifo": S3FIFOCache,
+    "wtinylfu": WTinyLFUCache,
+}
+
+# Backend capacities (in requests per second, and as a fraction of the offered load) for the cold start simulation
+cold_start_backends = [(5.0, "backend_0.5%"), (10.0, "backend_1%"), (20.0, "backend_2%"), (100.0, "backend_10%")]
+# Backend capacities for comparing cache policies. With the smaller backends above, the cache refills so slowly that
+#  it's never full again within a run, nothing is ever evicted, and every policy gives the same curve. These refill
+#  the 1000 entry cache within the run, so the policies' eviction choices decide how fast the hit rate recovers.
+policy_sweep_backends = [(50.0, "backend_5%"), (100.0, "backend_10%"), (200.0, "backend_20%")]
+
+# Run the cold start simulation with a range of backend capacities
+#  `policy_names` are the cache policies to run, from `policies`. If there's more than one, each run's name starts
+#   with its policy.
+#  `trace` is a trace file of keys to replay, instead of drawing them from the zipf distribution.
+#  `backends` is a list of backend capacities and names.
+# Each backend capacity gets its own key stream, which is the same for every policy, so the policies are compared on
+#  exactly the same requests.
+def run_sims(max_t, policy_names, trace=None, backends=cold_start_backends):
+    print("time,hits,misses,rate,name")
+    root = Streams()
+    for policy_name in policy_names:
+        prefix = "%s_"%(policy_name) if len(policy_names) > 1 else ""
+        for backend_max_rate, name in backends:
+            run_sim(1.3, 1000, 1000.0, backend_max_rate, prefix + name, max_t, policy=policies[policy_name], streams=root.spawn(name), trace=trace)
+
+experiments = {
+    "cold_start": lambda args: run_sims(args.max_t or 60.0, [args.policy], args.trace),
+    "policy_sweep": lambda args: run_sims(args.max_t or 60.0, list(policies), args.trace, policy_sweep_backends),
+}
+
+if __name__ == "__main__":
+    parser = cli.make_parser("Simulate cold-starting a cache in front of a rate-limited backend", experiments)
+    parser.add_argument("--policy", default="lru", choices=list(policies), help="Cache eviction policy for cold_start")
+    parser.add_argument("--trace", default=None, help="Replay the cache keys in the key column of this trace file, rather than drawing them")
+    args = cli.parse_args(parser, experiments, ["cold_start"])
+    for name in args.experiments:
+        experiments[name](args)
@@ -0,0 +1,325 @@
+# Cache eviction policies for the cold start simulator.
+#
+# Every policy has the same interface as `LRU` in `cache_sim.py`:
+#  `__init__(capacity)`: Make a cache holding up to `capacity` keys, primed with keys 1 to `capacity` (the most popular
+#    keys in the Zipf distribution), to simulate starting with a perfectly full cache.
+#  `is_cached(k)`: Look up `k`, returning `True` on a hit. This counts as an access for the policy's bookkeeping.
+#  `put(k, v)`: Insert `k` after a miss (evicting something if the cache is full). Returns `v`.
+#  `flush()`: Remove all keys from the cache.
+#
+# Unlike `LRU`, a missed lookup never evicts anything: only `put` does.
+from array import array
+from collections import OrderedDict, deque
+
+# CLOCK (second chance): slots arranged in a ring, each with a reference bit that's set on every hit. To evict, the
+#  hand sweeps around the ring clearing reference bits, and evicts the first slot it finds with the bit clear.
+class ClockCache(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.keys = array('q', range(1, capacity + 1))
+        self.referenced = bytearray(capacity)
+        self.map = dict(zip(self.keys, range(capacity)))
+        self.hand = 0
+
+    def is_cached(self, k):
+        s = self.map.get(k)
+        if s is None:
+            return False
+        self.referenced[s] = 1
+        return True
+
+    def put(self, k, v):
+        if self.is_cached(k):
+            return v
+        if len(self.map) < self.capacity:
+            # Still filling up after a flush, so take the next empty slot
+            s = len(self.map)
+        else:
+            referenced = self.referenced
+            s = self.hand
+            while referenced[s]:
+                referenced[s] = 0
+                s = s + 1 if s + 1 < self.capacity else 0
+            del self.map[self.keys[s]]
+            self.hand = s + 1 if s + 1 < self.capacity else 0
+        self.keys[s] = k
+        self.referenced[s] = 0
+        self.map[k] = s
+        return v
+
+    def flush(self):
+        self.map = {}
+        self.referenced = bytearray(self.capacity)
+        self.hand = 0
+
+# Least-frequently-used, with O(1) operations (Shah, Mitra and Matani, "An O(1) algorithm for implementing the LFU
+#  cache eviction scheme", 2010). Keys are grouped by access count, with each group in LRU order, so ties between
+#  equally-frequent keys are broken by recency.
+class LFUCache(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.flush()
+        for k in range(1, capacity + 1):
+            self.put(k, True)
+
+    def is_cached(self, k):
+        freq = self.freqs.get(k)
+        if freq is None:
+            return False
+        group = self.groups[freq]
+        del group[k]
+        if len(group) == 0:
+            del self.groups[freq]
+            if self.min_freq == freq:
+                self.min_freq = freq + 1
+        self.freqs[k] = freq + 1
+        self.groups.setdefault(freq + 1, OrderedDict())[k] = None
+        return True
+
+    def put(self, k, v):
+        if self.is_cached(k):
+            return v
+        if len(self.freqs) >= self.capacity:
+            group = self.groups[self.min_freq]
+            victim, _ = group.popitem(last=False)
+            if len(group) == 0:
+                del self.groups[self.min_freq]
+            del self.freqs[victim]
+        self.freqs[k] = 1
+        self.groups.setdefault(1, OrderedDict())[k] = None
+        self.min_freq = 1
+        return v
+
+    def flush(self):
+        self.freqs = {}
+        self.groups = {}
+        self.min_freq = 1
+
+# Adaptive Replacement Cache (Megiddo and Modha, "ARC: A Self-Tuning, Low Overhead Replacement Cache", FAST 2003).
+#  `t1` holds keys seen once recently, and `t2` keys seen at least twice. `b1` and `b2` are "ghost" lists of keys
+#  recently evicted from `t1` and `t2`. Misses that hit a ghost list move the target size `p` of `t1` towards
+#  whichever list would have kept the key.
+# The paper's single request operation is split in two here: the hit cases run in `is_cached`, and the miss cases
+#  (including ghost hits) run in `put`, which is only called when the backend could supply the key.
+class ARCCache(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.flush()
+        for k in range(1, capacity + 1):
+            self.put(k, True)
+
+    def is_cached(self, k):
+        if k in self.t1:
+            del self.t1[k]
+            self.t2[k] = None
+            return True
+        if k in self.t2:
+            self.t2.move_to_end(k)
+            return True
+        return False
+
+    # Evict from `t1` or `t2` into their ghost lists, depending on the target size `p`
+    def _replace(self, in_b2):
+        if len(self.t1) > 0 and (len(self.t1) > self.p or (in_b2 and len(self.t1) == self.p) or len(self.t2) == 0):
+            victim, _ = self.t1.popitem(last=False)
+            self.b1[victim] = None
+        else:
+            victim, _ = self.t2.popitem(last=False)
+            self.b2[victim] = None
+
+    def put(self, k, v):
+        if self.is_cached(k):
+            return v
+        c = self.capacity
+        if k in self.b1:
+            self.p = min(c, self.p + max(len(self.b2) // len(self.b1), 1))
+            self._replace(False)
+            del self.b1[k]
+            self.t2[k] = None
+        elif k in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) // len(self.b2), 1))
+            self._replace(True)
+            del self.b2[k]
+            self.t2[k] = None
+        else:
+            l1 = len(self.t1) + len(self.b1)
+            if l1 == c:
+                if len(self.t1) < c:
+                    self.b1.popitem(last=False)
+                    self._replace(False)
+                else:
+                    self.t1.popitem(last=False)
+            elif l1 < c:
+                total = l1 + len(self.t2) + len(self.b2)
+                if total >= c:
+                    if total == 2 * c:
+                        self.b2.popitem(last=False)
+                    if len(self.t1) + len(self.t2) >= c:
+                        self._replace(False)
+            self.t1[k] = None
+        return v
+
+    def flush(self):
+        self.t1 = OrderedDict()
+        self.t2 = OrderedDict()
+        self.b1 = OrderedDict()
+        self.b2 = OrderedDict()
+        self.p = 0
+
+# S3-FIFO (Yang et al., "FIFO queues are all you need for cache eviction", SOSP 2023). New keys go into a small FIFO
+#  queue `s` (10% of the cache), and only move to the main FIFO `m` if they're hit again before leaving it. Keys
+#  evicted from `s` are remembered in a ghost FIFO `g`, and go straight into `m` if they come back. Each key has a
+#  2-bit access count: `m` gives keys with a non-zero count another trip round the queue instead of evicting them.
+class S3FIFOCache(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.small_capacity = max(1, capacity // 10)
+        self.flush()
+        # The primed keys are known to be popular, so start them off in the main queue
+        for k in range(1, capacity + 1):
+            self.m.append(k)
+            self.freqs[k] = 0
+
+    def is_cached(self, k):
+        freq = self.freqs.get(k)
+        if freq is None:
+            return False
+        if freq < 3:
+            self.freqs[k] = freq + 1
+        return True
+
+    def _evict_small(self):
+        while len(self.s) > 0:
+            k = self.s.popleft()
+            if self.freqs[k] > 1:
+                self.m.append(k)
+                if len(self.m) > self.capacity - self.small_capacity:
+                    self._evict_main()
+            else:
+                del self.freqs[k]
+                self.g[k] = None
+                if len(self.g) > self.capacity - self.small_capacity:
+                    self.g.popitem(last=False)
+                return
+
+    def _evict_main(self):
+        while len(self.m) > 0:
+            k = self.m.popleft()
+            freq = self.freqs[k]
+            if freq > 0:
+                self.freqs[k] = freq - 1
+                self.m.append(k)
+            else:
+                del self.freqs[k]
+                return
+
+    def put(self, k, v):
+        if self.is_cached(k):
+            return v
+        while len(self.freqs) >= self.capacity:
+            if len(self.s) >= self.small_capacity or len(self.m) == 0:
+                self._evict_small()
+            else:
+                self._evict_main()
+        if k in self.g:
+            del self.g[k]
+            self.m.append(k)
+        else:
+            self.s.append(k)
+        self.freqs[k] = 0
+        return v
+
+    def flush(self):
+        self.s = deque()
+        self.m = deque()
+        self.g = OrderedDict()
+        self.freqs = {}
+
+# A count-min sketch (Cormode and Muthukrishnan, 2005) of recent access frequencies, with `depth` rows of 4-bit
+#  saturating counters. After `sample_size` increments, every counter is halved, so the sketch tracks recent
+#  popularity rather than all-time popularity (the "reset" operation from TinyLFU).
+class CountMinSketch(object):
+    def __init__(self, width, depth=4, sample_size=None):
+        self.width_bits = max(4, (width - 1).bit_length())
+        self.width = 1 << self.width_bits
+        self.depth = depth
+        self.counters = array('B', bytes(self.width * depth))
+        self.seeds = [0x9E3779B97F4A7C15 * (i + 1) & 0xFFFFFFFFFFFFFFFF for i in range(depth)]
+        self.sample_size = sample_size if sample_size is not None else 10 * self.width
+        self.additions = 0
+
+    def _indexes(self, k):
+        h = hash(k)
+        shift = 64 - self.width_bits
+        return [row * self.width + ((((h ^ seed) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF) >> shift)
+                for row, seed in enumerate(self.seeds)]
+
+    def add(self, k):
+        counters = self.counters
+        for i in self._indexes(k):
+            if counters[i] < 15:
+                counters[i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.counters = array('B', [c >> 1 for c in counters])
+            self.additions //= 2
+
+    def estimate(self, k):
+        counters = self.counters
+        return min(counters[i] for i in self._indexes(k))
+
+# W-TinyLFU (Einziger, Friedman and Manes, "TinyLFU: A Highly Efficient Cache Admission Policy", 2017), as used by
+#  Caffeine. New keys go into a small LRU window (1% of the cache). Keys leaving the window compete for a place in the
+#  main cache against the main cache's eviction victim, and only get in if the count-min sketch says they're more
+#  popular. The main cache is a segmented LRU, with keys hit while on probation promoted to the protected segment.
+class WTinyLFUCache(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.window_capacity = max(1, capacity // 100)
+        self.main_capacity = capacity - self.window_capacity
+        self.protected_capacity = int(self.main_capacity * 0.8)
+        self.sketch = CountMinSketch(capacity)
+        self.flush()
+        # The primed keys are known to be popular, so start them off in the main cache
+        for k in range(1, self.main_capacity + 1):
+            self.probation[k] = None
+        for k in range(self.main_capacity + 1, capacity + 1):
+            self.window[k] = None
+
+    def is_cached(self, k):
+        self.sketch.add(k)
+        if k in self.window:
+            self.window.move_to_end(k)
+            return True
+        if k in self.protected:
+            self.protected.move_to_end(k)
+            return True
+        if k in self.probation:
+            del self.probation[k]
+            self.protected[k] = None
+            if len(self.protected) > self.protected_capacity:
+                demoted, _ = self.protected.popitem(last=False)
+                self.probation[demoted] = None
+            return True
+        return False
+
+    def put(self, k, v):
+        if k in self.window or k in self.protected or k in self.probation:
+            return v
+        self.window[k] = None
+        if len(self.window) > self.window_capacity:
+            candidate, _ = self.window.popitem(last=False)
+            if len(self.probation) + len(self.protected) < self.main_capacity:
+                self.probation[candidate] = None
+            elif self.main_capacity > 0:
+                victims = self.probation if len(self.probation) > 0 else self.protected
+                victim = next(iter(victims))
+                if self.sketch.estimate(candidate) > self.sketch.estimate(victim):
+                    del victims[victim]
+                    self.probation[candidate] = None
+        return v
+
+    def flush(self):
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
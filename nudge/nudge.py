@@ -7,11 +7,21 @@
 # That sure sounds exciting! Beating FCFS with a simple heuristic across the whole tail is a very interesting thing to do.
 #
 # The model here is a simple M/G/1, with Poisson arrivals, and Weibull service time.
-import random
 import heapq
+import itertools
 import math
+import os
+import random
+import sys
+from array import array
 from collections import deque
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simlib import cli, engine
+from simlib.rng import Streams
+from simlib.sink import ResultSink
+from simlib.trace import TraceSource
+
 # We model three "types" of jobs: small, large, and extra large. Each "type" has an associated mean latency, and a probability
 #  of each job being that type.
 
@@ -34,21 +44,21 @@ large_t_scale = weibull_scale(large_t, weibull_shape)
 extra_large_t_scale = weibull_scale(extra_large_t, weibull_shape)
 
 # Models one Job in the system. In Nudge, each Job can be swapped exactly once, so we track
-#  whether the job has been swapped.
+#  whether the job has been swapped. Sizes are drawn from `rng` (see `simlib/rng.py`), unless `size` is given.
 class Job(object):
-    def __init__(self, t):
-        self.size = self.select_size()
+    def __init__(self, t, rng=random, size=None):
+        self.size = size if size is not None else self.select_size(rng)
         self.swapped = False
         self.created_t = t
 
-    def select_size(self):
-        r = random.random()
+    def select_size(self, rng):
+        r = rng.random()
         if r > (1.0 - extra_large_p):
-            return random.weibullvariate(extra_large_t_scale, weibull_shape)
+            return rng.weibullvariate(extra_large_t_scale, weibull_shape)
         elif r > (1.0 - extra_large_p - large_p):
-            return random.weibullvariate(large_t_scale, weibull_shape)
+            return rng.weibullvariate(large_t_scale, weibull_shape)
         else:
-            return random.weibullvariate(small_t_scale, weibull_shape)
+            return rng.weibullvariate(small_t_scale, weibull_shape)
 
 # First-Come-First-Served Queue
 class FCFSQueue(object):
@@ -98,32 +108,53 @@ class LIFOQueue(FCFSQueue):
     def name(self):
         return "LIFO"
 
-# Last In First Out (LIFO) Queue (aka, a stack)
-class RandomQueue(FCFSQueue):
+# Random order queue, which picks the next job using `rng`
+# The jobs are kept in a list in no particular order. To pop, we pick a random index, and move the last job into its
+#  place, so both `append` and `pop` are O(1) however long the queue gets.
+class RandomQueue(object):
+    def __init__(self, rng=random):
+        self.jobs = []
+        self.rng = rng
+
+    def append(self, job):
+        self.jobs.append(job)
+
     def pop(self):
-        val = self.deque[random.randrange(0, len(self.deque))]
-        self.deque.remove(val)
+        jobs = self.jobs
+        i = self.rng.randrange(len(jobs))
+        last = jobs.pop()
+        if i == len(jobs):
+            return last
+        val = jobs[i]
+        jobs[i] = last
         return val
 
+    def len(self):
+        return len(self.jobs)
+
     def name(self):
         return "Random"
 
 # The single server. All this does is service one request at a time from the queue.
+# Each completed job is recorded into `results`, a `Table` from `simlib/sink.py`.
 class Server(object):
-    def __init__(self, queue, sim_name):
+    def __init__(self, queue, results):
         self.busy = False
         self.queue = queue
         self.in_flight = None
-        self.sim_name = sim_name
+        (self.record_t, self.record_service_time, self.record_q_time) = results.appenders("t", "service_time", "q_time")
 
-    def job_done(self, t):
+    def job_done(self, t, _payload):
         assert(self.busy)
-        print("%f,%f,%f,%s"%(t, t - self.in_flight.created_t, t - self.in_flight.created_t - self.in_flight.size, self.sim_name))
+        job = self.in_flight
+        self.record_t(t)
+        self.record_service_time(t - job.created_t)
+        self.record_q_time(t - job.created_t - job.size)
 
         if self.queue.len() > 0:
             next_job = self.queue.pop()
             self.in_flight = next_job
-            return [(t + next_job.size, self.job_done)]
+            return [(t + next_job.size, self.job_done, None)]
         else:
             self.in_flight = None
             self.busy = False
@@ -134,47 +165,290 @@ class Server(object):
         self.busy = True
         self.in_flight = job
 
+    # A job has arrived at time `t`. Start it if the server is idle, returning the event for when it's done, or queue it.
+    def offer(self, t, job):
+        if self.busy:
+            self.queue.append(job)
+            return None
+        self.start(job)
+        return (t + job.size, self.job_done, None)
+
+# Size-based and age-based scheduling disciplines. These are preemptive, so they're run by a `PreemptiveServer`.
+#  Each queue is a heap ordered by the `rank` of each job (lowest first), with ties broken FCFS, so every operation is
+#  O(log n). A job's rank depends on its `size`, and on how much service it has had so far (`attained`) and still
+#  needs (`remaining`). A queued job isn't being served, so its rank doesn't change while it's in the heap.
+# The ranks of age-based policies (`age_based`) change while a job runs, so the server checks them every quantum.
+class RankQueue(object):
+    age_based = False
+
+    def __init__(self):
+        self.heap = []
+        self.seq = itertools.count()
+
+    def append(self, job):
+        heapq.heappush(self.heap, (self.rank(job), next(self.seq), job))
+
+    def pop(self):
+        return heapq.heappop(self.heap)[2]
+
+    def len(self):
+        return len(self.heap)
+
+    def best_rank(self):
+        return self.heap[0][0]
+
+# Shortest Remaining Processing Time, which minimizes the mean response time
+class SRPTQueue(RankQueue):
+    def rank(self, job):
+        return job.remaining
+
+    def name(self):
+        return "SRPT"
+
+# Preemptive Shortest Job First, which ranks jobs by their original size
+class PSJFQueue(RankQueue):
+    def rank(self, job):
+        return job.size
+
+    def name(self):
+        return "PSJF"
+
+# Foreground-Background (aka Least Attained Service), which serves the jobs that have had the least service so far, and
+#  round-robins between jobs that have had the same amount. It doesn't need to know job sizes.
+class FBQueue(RankQueue):
+    age_based = True
+
+    def rank(self, job):
+        return job.attained
+
+    def name(self):
+        return "FB"
+
+# Gittins index policy, which minimizes the mean response time when job sizes aren't known, but their distribution
+#  is (Gittins, "Multi-armed Bandit Allocation Indices", 1989). The ranks for our three-class Weibull mix are computed
+#  on a grid of ages up front (see `gittins_ranks`).
+class GittinsQueue(RankQueue):
+    age_based = True
+
+    def __init__(self, step=0.1):
+        super().__init__()
+        self.step = step
+        self.ranks = gittins_ranks(step)
+
+    def rank(self, job):
+        return self.ranks[min(int(job.attained / self.step), len(self.ranks) - 1)]
+
+    def name(self):
+        return "Gittins"
+
+# The CDF of the job size distribution (the mix of three Weibull distributions above) at `x`
+def size_cdf(x, exp=math.exp):
+    p_small = 1.0 - extra_large_p - large_p
+    return (p_small * (1.0 - exp(-(x / small_t_scale) ** weibull_shape)) +
+            large_p * (1.0 - exp(-(x / large_t_scale) ** weibull_shape)) +
+            extra_large_p * (1.0 - exp(-(x / extra_large_t_scale) ** weibull_shape)))
+
+# The Gittins rank (the reciprocal of the Gittins index) of a job that has had `i * step` seconds of service, for each
+#  `i` up to `max_age / step`. The rank at age `a` is the least expected service per completion we can get by serving
+#  the job for some further time `d`: min over `d` of E[min(S - a, d) | S > a] / P(S - a <= d | S > a), where the
+#  conditioning cancels out. The integral is a running sum over the grid. Needs numpy.
+def gittins_ranks(step, max_age=4.0 * extra_large_t):
+    import numpy
+    ages = numpy.arange(0.0, max_age + step, step)
+    cdf = size_cdf(ages, numpy.exp)
+    # The integral of the survival function from 0 to each age, with the trapezoid rule
+    survival = 1.0 - cdf
+    integral = numpy.concatenate(([0.0], numpy.cumsum((survival[1:] + survival[:-1]) * step / 2.0)))
+    ranks = []
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        for i in range(len(ages) - 1):
+            completed = cdf[i + 1:] - cdf[i]
+            served = integral[i + 1:] - integral[i]
+            per_completion = numpy.where(completed > 0.0, served / completed, numpy.inf)
+            ranks.append(float(per_completion.min()))
+    ranks.append(ranks[-1])
+    return ranks
+
+# Preemptive server for the `RankQueue` disciplines. An arriving job preempts the running job if it has a lower rank.
+#  For age-based disciplines, the running job is run a `quantum` at a time, and preempted at the end of a quantum if
+#  a queued job has a lower rank by then.
+# Preempted jobs go back on the queue with their service so far. Each slice of service is one event, and the events of
+#  preempted slices are ignored when they come up, by checking the `generation` in their payload.
+class PreemptiveServer(object):
+    def __init__(self, queue, results, quantum=0.1):
+        self.queue = queue
+        self.quantum = quantum if queue.age_based else math.inf
+        self.running = None
+        self.slice_start_t = 0.0
+        self.completes = False
+        self.generation = 0
+        (self.record_t, self.record_service_time, self.record_q_time) = results.appenders("t", "service_time", "q_time")
+
+    def offer(self, t, job):
+        job.remaining = job.size
+        job.attained = 0.0
+        running = self.running
+        if running is None:
+            return self.run(t, job)
+        self.account(t)
+        if self.queue.rank(job) < self.queue.rank(running):
+            self.queue.append(running)
+            return self.run(t, job)
+        self.queue.append(job)
+        return None
+
+    # Account for the service the running job has had since the start of its slice
+    def account(self, t):
+        running = self.running
+        served = t - self.slice_start_t
+        running.remaining -= served
+        running.attained += served
+        self.slice_start_t = t
+
+    # Start a slice of service for `job`, returning the event for the end of the slice
+    def run(self, t, job):
+        self.running = job
+        self.slice_start_t = t
+        self.completes = job.remaining <= self.quantum
+        self.generation += 1
+        return (t + min(job.remaining, self.quantum), self.slice_done, self.generation)
+
+    def slice_done(self, t, generation):
+        if generation != self.generation:
+            # This slice was cut short by a preemption
+            return None
+        job = self.running
+        queue = self.queue
+        if self.completes:
+            self.record_t(t)
+            self.record_service_time(t - job.created_t)
+            self.record_q_time(t - job.created_t - job.size)
+            self.running = None
+            if queue.len() > 0:
+                return [self.run(t, queue.pop())]
+            return None
+        self.account(t)
+        if queue.len() > 0 and queue.best_rank() < queue.rank(job):
+            queue.append(job)
+            return [self.run(t, queue.pop())]
+        return [self.run(t, job)]
+
 # Load generation client. Creates an unbounded concurrency
+#  Inter-arrival times and job sizes are drawn from their own pooled streams of `streams` (see `simlib/rng.py`), which
+#  by default is seeded from the global RNG.
 class Client(object):
-    def __init__(self, rho, server):
+    def __init__(self, rho, server, streams=None):
         self.rate_tps = rho / (small_t * (1.0 - extra_large_p - large_p) + large_t * large_p + extra_large_t * extra_large_p)
         self.server = server
+        streams = streams or Streams()
+        self.arrivals = streams.pooled("arrivals")
+        self.sizes = streams.pooled("sizes")
 
-    def generate(self, t):
-        job = Job(t)
-        next_t = t + random.expovariate(self.rate_tps)
-        if self.server.busy:
-            self.server.queue.append(job)
-            return [(next_t, self.generate)]
-        else:
-            self.server.start(job)
-        return [(next_t, self.generate), (t + job.size, self.server.job_done)]
+    def generate(self, t, _payload):
+        job = Job(t, self.sizes)
+        next_t = t + self.arrivals.expovariate(self.rate_tps)
+        done = self.server.offer(t, job)
+        if done is None:
+            return [(next_t, self.generate, None)]
+        return [(next_t, self.generate, None), done]
 
-# Run a single simulation.        
-def sim_loop(max_t, client):
+# Draw a trace of the arrival times and sizes of the jobs that `Client(rho, ...)` would generate before `max_t`, as
+#  two arrays
+def make_trace(rho, max_t, streams=None):
+    client = Client(rho, None, streams)
+    times = array('d')
+    sizes = array('d')
     t = 0.0
-    q = [(t, client.generate)]
-    # This is the core simulation loop. Until we've reached the maximum simulation time, pull the next event off
-    #  from a heap of events, fire whichever callback is associated with that event, and add any events it generates
-    #  back to the heap.
-    while len(q) > 0 and t < max_t:
-        # Get the next event. Because `q` is a heap, we can just pop this off the front of the heap.
-        (t, call) = heapq.heappop(q)
-        # Execute the callback associated with this event
-        new_events = call(t)
-        # If the callback returned any follow-up events, add them to the event queue `q` and make sure its still a valid heap
-        if new_events is not None:
-            q.extend(new_events)
-            heapq.heapify(q)
-
-def run_sims(max_t):
-    print("t,service_time,q_time,name")
-    for q_type in [FCFSQueue, LIFOQueue, RandomQueue]:
-        for rho in [0.8]:
-            queue = q_type()
-            server = Server(queue, "%s_%.2f"%(queue.name(), rho))
-            client = Client(rho, server)
-            sim_loop(max_t, client)
-
-#print((small_t * (1.0 - extra_large_p - large_p) + large_t * large_p + extra_large_t * extra_large_p))
-run_sims(1000000.0)
+    while t < max_t:
+        times.append(t)
+        sizes.append(Job(t, client.sizes).size)
+        t += client.arrivals.expovariate(client.rate_tps)
+    return (times, sizes)
+
+# Load generation client that replays a trace of (arrival time, size) rows, in time order. The rows can come from
+#  `make_trace`, so that several queues can be run on exactly the same jobs (common random numbers), or from a
+#  `TraceSource` (see `simlib/trace.py`) to replay a production trace.
+# With common random numbers, the jobs' behavior only differs in how they're queued, so the difference between
+#  policies can be measured with much shorter runs than with independent arrivals.
+# Each arrival event carries the job's size. The first event (from `sim_loop`) has no size, and just schedules the
+#  first arrival.
+class TraceClient(object):
+    def __init__(self, rows, server):
+        self.rows = iter(rows)
+        self.server = server
+
+    def generate(self, t, size):
+        row = next(self.rows, None)
+        events = [(row[0], self.generate, row[1])] if row is not None else []
+        if size is None:
+            return events
+        done = self.server.offer(t, Job(t, size=size))
+        if done is not None:
+            events.append(done)
+        return events
+
+# Queue disciplines that can be picked by name. The `RankQueue` ones are run with a `PreemptiveServer`.
+queue_types = {
+    "fcfs": FCFSQueue,
+    "nudge": NudgeQueue,
+    "lifo": LIFOQueue,
+    "random": RandomQueue,
+    "srpt": SRPTQueue,
+    "psjf": PSJFQueue,
+    "fb": FBQueue,
+    "gittins": GittinsQueue,
+}
+
+# Run a single simulation.
+def sim_loop(max_t, client, scheduler=None):
+    engine.sim_loop(max_t, [(0.0, client.generate, None)], scheduler)
+
+# Run each queue type, writing the results for every job to `out` (stdout by default, see `simlib/sink.py` for the
+#  other formats, or `None` to not write them at all). If `summary` is set, write a summary of the latency percentiles
+#  for each queue type in `policies` (names from `queue_types`) to it.
+# Each run gets its own random streams (see `simlib/rng.py`), spawned from one root stream. With `crn` set, the jobs for
+#  each `rho` are drawn once instead, and replayed through every queue type. With `trace` set, every queue type replays
+#  the `t` and `size` columns of that trace file instead (see `simlib/trace.py`).
+def run_sims(max_t, out="-", summary=None, crn=False, trace=None, policies=("fcfs", "lifo", "random")):
+    summarize = ["service_time", "q_time"] if summary is not None else []
+    root = Streams()
+    rhos = [0.8] if trace is None else ["trace"]
+    traces = {rho: make_trace(rho, max_t, root.spawn("trace_%.2f"%(rho))) for rho in rhos} if crn and trace is None else {}
+    with ResultSink(out, ["t", "service_time", "q_time", "name"], summarize=summarize, summary_out=summary) as sink:
+        for q_type in [queue_types[policy] for policy in policies]:
+            for rho in rhos:
+                queue = q_type()
+                name = "%s_%.2f"%(queue.name(), rho) if trace is None else "%s_trace"%(queue.name())
+                streams = root.spawn(name)
+                if q_type is RandomQueue:
+                    queue.rng = streams.stream("queue")
+                server = (PreemptiveServer if isinstance(queue, RankQueue) else Server)(queue, sink.table(name=name))
+                if trace is not None:
+                    client = TraceClient(TraceSource(trace, ["t", "size"]).rows(), server)
+                elif crn:
+                    client = TraceClient(zip(*traces[rho]), server)
+                else:
+                    client = Client(rho, server, streams)
+                sim_loop(max_t, client)
+                sink.flush()
+
+experiments = {
+    "policies": lambda args: run_sims(args.max_t or 1000000.0, None if args.no_raw else args.output, args.summary, args.crn, args.trace, args.policies.split(",")),
+}
+
+if __name__ == "__main__":
+    #print((small_t * (1.0 - extra_large_p - large_p) + large_t * large_p + extra_large_t * extra_large_p))
+    parser = cli.make_parser("Simulate an M/G/1 queue under FCFS, LIFO, Random, Nudge, and size-based policies", experiments)
+    parser.add_argument("--output", default="-", help="Where to write per-job results: a .csv, .npy or .parquet file, or - for stdout")
+    parser.add_argument("--no-raw", action="store_true", help="Don't write per-job results")
+    parser.add_argument("--summary", default=None, help="Where to write latency percentiles for each policy: a .csv file, or - for stdout")
+    parser.add_argument("--crn", action="store_true", help="Run every policy on the same jobs (common random numbers)")
+    parser.add_argument("--trace", default=None, help="Replay the arrival times and sizes in the t and size columns of this trace file")
+    parser.add_argument("--policies", default="fcfs,lifo,random",
+                        help="Comma-separated queue disciplines to run, from: %s"%(", ".join(queue_types)))
+    args = cli.parse_args(parser, experiments, ["policies"])
+    for policy in args.policies.split(","):
+        if policy not in queue_types:
+            parser.error("unknown policy '%s'"%(policy))
+    for name in args.experiments:
+        experiments[name](args)
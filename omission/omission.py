@@ -1,20 +1,31 @@
 # Small simulator for measuring the difference between open-loop and closed-loop client-observed latency in a G/G/c queuing system.
 # Created for the blog post https://brooker.co.za/blog/2023/05/10/open-closed.html
-import random
-import heapq
+import io
 import math
+import os
+import random
+import sys
 from collections import deque
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simlib import cli, engine
+from simlib.rng import Streams
+from simlib.sink import ResultSink, summary_columns
+from simlib.sweep import run_sweep
+from simlib.trace import TraceSource
+
 # Convert from a mean and shape to the 'scale' parameter that Python's weibullvariate expects
 def weibull_scale(mean, shape):
     return mean/math.gamma(1.0 + 1.0 / shape)
 
+# Job types are made with `job_type(t, rng)`, and draw their size from `rng` (see `simlib/rng.py`)
+
 # Job with unimodal exponentially distributed latency
 def exp_job(mean):
     class ExpJob(object):
-        def __init__(self, t):
+        def __init__(self, t, rng=random):
             self.created_t = t
-            self.size = random.expovariate(1.0 / mean)
+            self.size = rng.expovariate(1.0 / mean)
         def mean():
             return mean
     return ExpJob
@@ -22,12 +33,12 @@ def exp_job(mean):
 # Job with bimodal exponentially distributed latency
 def bimod_job(mean_1, mean_2, p):
     class BiModJob(object):
-        def __init__(self, t):
+        def __init__(self, t, rng=random):
             self.created_t = t
-            if random.random() > p:
-                self.size = random.expovariate(1.0 / mean_1)
+            if rng.random() > p:
+                self.size = rng.expovariate(1.0 / mean_1)
             else:
-                self.size = random.expovariate(1.0 / mean_2)
+                self.size = rng.expovariate(1.0 / mean_2)
         def mean():
             return (1.0 - p)*mean_1 + p*mean_2
     return BiModJob
@@ -35,9 +46,9 @@ def bimod_job(mean_1, mean_2, p):
 # Job with Weibull-distributed latency
 def weibull_job(mean, shape):
     class WeibullJob(object):
-        def __init__(self, t):
+        def __init__(self, t, rng=random):
             self.created_t = t
-            self.size = random.weibullvariate(weibull_scale(mean, shape), shape)
+            self.size = rng.weibullvariate(weibull_scale(mean, shape), shape)
         def mean():
             return mean
     return WeibullJob
@@ -60,6 +71,8 @@ class FCFSQueue(object):
         return "FCFS"
 
 # Server that consumes a queue of tasks, with a fixed concurrency (MPL)
+# `jobs` holds the job running in each of the `mpl` slots, and `free` is a stack of the slots that aren't running
+#  anything, so finding a free slot is O(1) however big `mpl` is.
 class Server(object):
     def __init__(self, mpl, sim_name, client, rho):
         self.busy = 0
@@ -67,13 +80,16 @@ class Server(object):
         self.sim_name = sim_name
         self.mpl = mpl
         self.jobs = [ None for i in range(mpl) ]
+        self.free = list(range(mpl - 1, -1, -1))
         self.client = client
         self.rho = rho
 
     def job_done(self, t, n):
         assert(self.busy > 0)
         completed = self.jobs[n]
-        self.file.write("%f,%f,%f,%s,%d\n"%(t, self.rho, t - completed.created_t,  self.sim_name, self.queue.len()))
+        self.record_t(t)
+        self.record_service_time(t - completed.created_t)
+        self.record_qlen(self.queue.len())
 
         events = []
         if self.queue.len() > 0:
@@ -83,6 +99,7 @@ class Server(object):
         else:
             self.busy -= 1
             self.jobs[n] = None
+            self.free.append(n)
             
         done_event = self.client.done(t, completed)
         if done_event is not None:
@@ -90,30 +107,38 @@ class Server(object):
 
         return events
 
+    # Record each completed job into a new table in `sink` (see `simlib/sink.py`)
+    def record_to(self, sink):
+        results = sink.table(rho=self.rho, name=self.sim_name)
+        (self.record_t, self.record_service_time, self.record_qlen) = results.appenders("t", "service_time", "qlen")
+
     def offer(self, job, t):
         if self.busy < self.mpl:
             # The server isn't entirely busy, so we can start on the job immediately
             self.busy += 1
-            for i in range(self.mpl):
-                if self.jobs[i] is None:
-                    self.jobs[i] = job
-                    return (t + job.size, self.job_done, i)
-            # Should never get here because jobs slots should always be available if busy < mpl
-            assert(False)
+            n = self.free.pop()
+            self.jobs[n] = job
+            return (t + job.size, self.job_done, n)
         else:
             # The server is busy, so enqueue the job
             self.queue.append(job)
             return None
 
+# Each client draws from its own pooled random streams (see `simlib/rng.py`): `arrivals` for inter-arrival or think
+#  times, and `sizes` for job sizes. By default, a client gets new streams seeded from the global RNG.
+
 # Open loop load generation client. Creates an unbounded concurrency
 class OpenLoopClient(object):
-    def __init__(self, rho, job_type):
+    def __init__(self, rho, job_type, streams=None):
         self.rate_tps = rho / job_type.mean()
         self.job_type = job_type
+        streams = streams or Streams()
+        self.arrivals = streams.pooled("arrivals")
+        self.sizes = streams.pooled("sizes")
 
     def generate(self, t, _payload):
-        job = self.job_type(t)
-        next_t = t + random.expovariate(self.rate_tps)
+        job = self.job_type(t, self.sizes)
+        next_t = t + self.arrivals.expovariate(self.rate_tps)
         offered = self.server.offer(job, t)
         if offered is None:
             return [(next_t, self.generate, None)]
@@ -125,33 +150,39 @@ class OpenLoopClient(object):
 
 # Closed loop load generation client. Creates a fixed concurrency
 class ClosedLoopClient(object):
-    def __init__(self, rho, job_type, mpl):
+    def __init__(self, rho, job_type, mpl, streams=None):
         self.job_type = job_type
         self.mpl = mpl
         self.think_t = (1.0 - rho) * job_type.mean()
         self.think_t += (mpl - 1.0) * job_type.mean() / rho
+        streams = streams or Streams()
+        self.arrivals = streams.pooled("arrivals")
+        self.sizes = streams.pooled("sizes")
 
     def generate(self, t, _payload):
-        offers = [ self.server.offer(self.job_type(t), t) for i in range(self.mpl) ]
+        offers = [ self.server.offer(self.job_type(t, self.sizes), t) for i in range(self.mpl) ]
         return [ o for o in offers if o is not None ]
 
     def think_done(self, t, _payload):
-        offer_rsp = self.server.offer(self.job_type(t), t)
+        offer_rsp = self.server.offer(self.job_type(t, self.sizes), t)
         return [offer_rsp] if offer_rsp is not None else None
 
     def done(self, t, _event):
-        return (t + random.expovariate(1.0/self.think_t), self.think_done, None)
+        return (t + self.arrivals.expovariate(1.0/self.think_t), self.think_done, None)
 
 # Open loop load generation client. Creates an unbounded concurrency
 class OpenLoopClientWithTimeout(object):
-    def __init__(self, rho, job_type, timeout):
+    def __init__(self, rho, job_type, timeout, streams=None):
         self.rate_tps = rho / job_type.mean()
         self.job_type = job_type
         self.timeout = timeout
+        streams = streams or Streams()
+        self.arrivals = streams.pooled("arrivals")
+        self.sizes = streams.pooled("sizes")
 
     def generate(self, t, _payload):
-        job = self.job_type(t)
-        next_t = t + random.expovariate(self.rate_tps)
+        job = self.job_type(t, self.sizes)
+        next_t = t + self.arrivals.expovariate(self.rate_tps)
         offered = self.server.offer(job, t)
         if offered is None:
             return [(next_t, self.generate, None)]
@@ -161,37 +192,65 @@ class OpenLoopClientWithTimeout(object):
     def done(self, t, event):
         if t - event.created_t > self.timeout:
             # Offer another job as a replacement for the timed-out one
-            return self.server.offer(self.job_type(t), t)
+            return self.server.offer(self.job_type(t, self.sizes), t)
         else:
             return None
 
+# A job from a trace, with a given size
+class TraceJob(object):
+    def __init__(self, t, size):
+        self.created_t = t
+        self.size = size
+
+# Open loop load generation client that replays a trace of (arrival time, size) rows, in time order, like the ones from
+#  a `TraceSource` (see `simlib/trace.py`). Each arrival event carries the job's size. The first event (from
+#  `sim_loop`) has no size, and just schedules the first arrival.
+class TraceClient(object):
+    def __init__(self, rows):
+        self.rows = iter(rows)
+
+    def generate(self, t, size):
+        row = next(self.rows, None)
+        events = [(row[0], self.generate, row[1])] if row is not None else []
+        if size is not None:
+            offered = self.server.offer(TraceJob(t, size), t)
+            if offered is not None:
+                events.append(offered)
+        return events
+
+    def done(self, t, _event):
+        return None
 
-# Run a single simulation.        
-def sim_loop(max_t, client):
-    t = 0.0
-    q = [(t, client.generate, None)]
-    # This is the core simulation loop. Until we've reached the maximum simulation time, pull the next event off
-    #  from a heap of events, fire whichever callback is associated with that event, and add any events it generates
-    #  back to the heap.
-    while len(q) > 0 and t < max_t:
-        # Get the next event. Because `q` is a heap, we can just pop this off the front of the heap.
-        (t, call, payload) = heapq.heappop(q)
-        # Execute the callback associated with this event
-        new_events = call(t, payload)
-        # If the callback returned any follow-up events, add them to the event queue `q` and make sure its still a valid heap
-        if new_events is not None:
-            q.extend(new_events)
-            heapq.heapify(q)
+# Run a single simulation.
+def sim_loop(max_t, client, scheduler=None):
+    engine.sim_loop(max_t, [(0.0, client.generate, None)], scheduler)
 
 # Run a simulation, outputting the results to `fn`. One simulation is run for each client in `clients`.
 #  `max_t` is the maximum time to run the simulation.
-def run_sims(max_t, clients, fn):
+#  If `fn` is `None`, the per-job results aren't written. If `summary_fn` is set, the latency percentiles for each
+#   simulation are written to it.
+def run_sims(max_t, clients, fn, summary_fn=None):
     print("Running sim")
-    with open(fn, "w") as f:
-        f.write("t,rho,service_time,name,qlen\n")
+    with make_sink(fn, summary_out=summary_fn) as sink:
         for client in clients:
-            client.server.file = f
+            client.server.record_to(sink)
             sim_loop(max_t, client)
+            sink.flush()
+
+# Columns of the per-job results
+result_columns = ["t", "rho", "service_time", "name", "qlen"]
+
+# Make a sink for per-job results, writing to `out` (a file name, a file object, or `None`), and summarizing latency
+#  to `summary_out` (if it's set)
+def make_sink(out, header=True, summary_out=None):
+    summarize = ["service_time"] if summary_out is not None else []
+    return ResultSink(out, result_columns, {"qlen": "%d"}, header, summarize, summary_out)
+
+# The output files for the experiment called `name`
+def outputs(args, name):
+    fn = None if args.no_raw else "%s_results.csv"%(name)
+    summary_fn = "%s_summary.csv"%(name) if args.summary else None
+    return (fn, summary_fn)
 
 # Simulation with unimodal exponential service time
 def make_sim_exp():
@@ -266,6 +325,13 @@ def make_sim_weibull():
         clients.append(client)
     return clients
 
+# Simulation replaying the `t` and `size` columns of the trace file `path`. The offered load isn't known up front, so
+#  `rho` is NaN.
+def make_sim_trace(path):
+    client = TraceClient(TraceSource(path, ["t", "size"]).rows())
+    client.server = Server(1, "trace", client, math.nan)
+    return [client]
+
 # Sweep over a range of `rho` values, and run a simulation for each value.
 def weibull_rho_sweep():
     name = "rho_sweep"
@@ -276,10 +342,62 @@ def weibull_rho_sweep():
         client.server = Server(1, name, client, rho)
         clients.append(client)
     return clients
-        
+
+# Run one cell of the `rho` or `mpl` sweep, returning its CSV output and CSV latency summary (without headers).
+#  With `mpl` workers, jobs arrive `mpl` times as fast, so that each worker is busy a `rho` fraction of the time.
+def weibull_rho_cell(rho, max_t, raw=True, summary=False, mpl=1, name="rho_sweep"):
+    client = OpenLoopClient(rho * mpl, weibull_job(0.1, 2.0))
+    client.server = Server(mpl, name, client, rho)
+    out = io.StringIO() if raw else None
+    summary_out = io.StringIO() if summary else None
+    sink = make_sink(out, False, summary_out)
+    client.server.record_to(sink)
+    sim_loop(max_t, client)
+    sink.close()
+    return (out.getvalue() if raw else "", summary_out.getvalue() if summary else "")
+
+# Run the same sweep as `weibull_rho_sweep`, with the cells run in parallel (see `simlib/sweep.py`), outputting the
+#  results to `fn` and the latency summary to `summary_fn` (if they're set) in `rho` order.
+def run_weibull_rho_sweep(max_t, fn, summary_fn=None, workers=None, seed=None):
+    cells = [(rho_i / 10.0, max_t, fn is not None, summary_fn is not None) for rho_i in range(1, 10)]
+    run_weibull_sweep(cells, fn, summary_fn, workers, seed)
+
+# Sweep over a range of worker pool sizes (`mpl`), from a single server up to a large pool, all under heavy load, with
+#  the cells run in parallel like `run_weibull_rho_sweep`. Each run is named after its `mpl`.
+def run_weibull_mpl_sweep(max_t, fn, summary_fn=None, workers=None, seed=None, rho=0.95):
+    cells = [(rho, max_t, fn is not None, summary_fn is not None, mpl, "mpl_%d"%(mpl)) for mpl in [1, 2, 4, 8, 16, 32, 64, 128, 256]]
+    run_weibull_sweep(cells, fn, summary_fn, workers, seed)
+
+# Run the `weibull_rho_cell` for each of `cells` in parallel, and write their outputs in order
+def run_weibull_sweep(cells, fn, summary_fn=None, workers=None, seed=None):
+    print("Running sim")
+    cell_outputs = run_sweep(weibull_rho_cell, cells, workers, seed)
+    for (out_fn, i, header) in [(fn, 0, result_columns), (summary_fn, 1, summary_columns(["rho", "name"]))]:
+        if out_fn is not None:
+            with open(out_fn, "w") as f:
+                f.write(",".join(header) + "\n")
+                for output in cell_outputs:
+                    f.write(output[i])
+
 run_t = 5000.0
-run_sims(run_t, make_sim_bimod_timeout(), "bimod_timeout_results.csv")
-run_sims(run_t, make_sim_exp(), "exp_results.csv")
-run_sims(run_t, make_sim_bimod(), "bimod_results.csv")
-run_sims(run_t, make_sim_weibull(), "weibull_results.csv")
-run_sims(20000, weibull_rho_sweep(), "rho_sweep_results.csv")
+
+experiments = {
+    "bimod_timeout": lambda args: run_sims(args.max_t or run_t, make_sim_bimod_timeout(), *outputs(args, "bimod_timeout")),
+    "exp": lambda args: run_sims(args.max_t or run_t, make_sim_exp(), *outputs(args, "exp")),
+    "bimod": lambda args: run_sims(args.max_t or run_t, make_sim_bimod(), *outputs(args, "bimod")),
+    "weibull": lambda args: run_sims(args.max_t or run_t, make_sim_weibull(), *outputs(args, "weibull")),
+    "rho_sweep": lambda args: run_weibull_rho_sweep(args.max_t or 20000, *outputs(args, "rho_sweep"), args.workers, args.seed),
+    "mpl_sweep": lambda args: run_weibull_mpl_sweep(args.max_t or 1000, *outputs(args, "mpl_sweep"), args.workers, args.seed),
+    "trace": lambda args: run_sims(args.max_t or math.inf, make_sim_trace(args.trace), *outputs(args, "trace")),
+}
+
+if __name__ == "__main__":
+    parser = cli.make_parser("Simulate open- and closed-loop clients against a G/G/c queue", experiments)
+    parser.add_argument("--no-raw", action="store_true", help="Don't write per-job results")
+    parser.add_argument("--summary", action="store_true", help="Write latency percentiles for each simulation to <experiment>_summary.csv")
+    parser.add_argument("--trace", default=None, help="Trace file for the trace experiment, with t and size columns")
+    args = cli.parse_args(parser, experiments, ["bimod_timeout", "exp", "bimod", "weibull", "rho_sweep"])
+    if "trace" in args.experiments and args.trace is None:
+        parser.error("the trace experiment needs --trace")
+    for name in args.experiments:
+        experiments[name](args)
@@ -0,0 +1,247 @@
+# Simulation of a whole ski resort: a network of lifts and slopes, with a queue at the bottom of every lift.
+#
+# This extends `ski_sim.py` (see the "network of slopes and lifts" exercise in the README). The resort is a graph:
+#  each lift carries skiiers from its bottom node to its top node, and each slope takes them from its top node down to
+#  its bottom node. When a skiier gets off a lift, they pick one of the slopes from the top, and when they get to the
+#  bottom of a slope they pick one of the lifts there with a routing policy, and join its queue.
+#
+# To scale to a whole mountain (tens of lifts and tens of thousands of skiiers for a full day), skiiers aren't
+#  objects. Each skiier is an index into compact arrays of their speed, state and location, and events carry that
+#  index. Each lift queue is a deque of skiier indexes, and lifts are rings of chairs on a cable like
+#  `ski_sim.RingLift`, so each chair costs one event whoever is on it. The only per-skiier event is reaching the bottom
+#  of a slope.
+import random
+from array import array
+from collections import deque
+
+from simlib import cli, engine
+from simlib.rng import Streams
+from simlib.sweep import run_sweep
+
+# Skiier states, as stored in `Resort.state`
+WAITING = 0
+RIDING_LIFT = 1
+SKIING = 2
+
+# The arithmetic mean of the numbers in `l`
+def avg(l):
+    return sum(l)/float(len(l)) if len(l) > 0 else 0.0
+
+class Slope(object):
+    def __init__(self, index, name, top, bottom, length_m):
+        self.index = index
+        self.name = name
+        self.top = top
+        self.bottom = bottom
+        self.length_m = length_m
+
+# A lift from node `bottom` to node `top`, with its own queue. Every ride takes `ride_time` rounded to a whole number
+#  of `chair_period`s. The chairs on the way up are a ring buffer: every chair period, the chair in the current slot
+#  unloads at the top, and the slot is filled by the next chair leaving the bottom.
+class ResortLift(object):
+    def __init__(self, resort, index, name, bottom, top, ride_time, chair_width, chair_period):
+        self.resort = resort
+        self.index = index
+        self.name = name
+        self.bottom = bottom
+        self.top = top
+        self.chair_width = chair_width
+        self.chair_period = chair_period
+        self.queue = deque()
+        self.chairs = [[] for i in range(max(1, round(ride_time / chair_period)))]
+        self.slot = 0
+        self.boardings = 0
+
+    def dequeue_skiiers(self, t, _payload):
+        resort = self.resort
+        events = [(t + self.chair_period, self.dequeue_skiiers, None)]
+        slot = self.slot
+        for s in self.chairs[slot]:
+            events.append(resort.leave_lift(t, s, self))
+        riders = []
+        queue = self.queue
+        for i in range(min(self.chair_width, len(queue))):
+            s = queue.popleft()
+            resort.board(t, s)
+            riders.append(s)
+        self.boardings += len(riders)
+        self.chairs[slot] = riders
+        self.slot = slot + 1 if slot + 1 < len(self.chairs) else 0
+        return events
+
+# Routing policies, which pick which of `lifts` skiier `s` queues for next.
+
+# Pick a lift at random
+def random_route(resort, lifts, s):
+    return lifts[resort.rng.randrange(len(lifts))] if len(lifts) > 1 else lifts[0]
+
+# Pick the lift with the shortest queue
+def shortest_queue_route(resort, lifts, s):
+    return min(lifts, key=lambda lift: len(lift.queue))
+
+routing_policies = {
+    "random": random_route,
+    "shortest_queue": shortest_queue_route,
+}
+
+# `Resort` is the graph of lifts and slopes, and the state of all the skiiers on it.
+#  `route` is the routing policy for picking lifts, from `routing_policies`.
+#  `rng` is the random stream (see `simlib/rng.py`) for picking slopes and routes.
+class Resort(object):
+    def __init__(self, route=random_route, rng=random):
+        self.route = route
+        self.rng = rng
+        self.lifts = []
+        self.slopes = []
+        # The lifts from the bottom of each node, and the slopes from the top of each node
+        self.lifts_from = {}
+        self.slopes_from = {}
+        # Per-skiier state
+        self.speed = array('d')
+        self.state = bytearray()
+        self.slope = array('i')
+        # The number of skiiers in each state
+        self.counts = [0, 0, 0]
+
+    def add_lift(self, name, bottom, top, ride_time, chair_width, chair_period):
+        lift = ResortLift(self, len(self.lifts), name, bottom, top, ride_time, chair_width, chair_period)
+        self.lifts.append(lift)
+        self.lifts_from.setdefault(bottom, []).append(lift)
+        return lift
+
+    def add_slope(self, name, top, bottom, length_m):
+        slope = Slope(len(self.slopes), name, top, bottom, length_m)
+        self.slopes.append(slope)
+        self.slopes_from.setdefault(top, []).append(slope)
+        return slope
+
+    # Check that skiiers can't get stuck: every lift needs a slope down from its top, and every slope needs a lift up
+    #  from its bottom
+    def validate(self):
+        for lift in self.lifts:
+            if lift.top not in self.slopes_from:
+                raise ValueError("no slope down from the top of lift '%s'"%(lift.name))
+        for slope in self.slopes:
+            if slope.bottom not in self.lifts_from:
+                raise ValueError("no lift up from the bottom of slope '%s'"%(slope.name))
+
+    # Add a skiier who skis at `speed`, starting in the queue for one of the lifts at `node`
+    def add_skiier(self, speed, node):
+        s = len(self.speed)
+        self.speed.append(speed)
+        self.state.append(WAITING)
+        self.slope.append(-1)
+        self.counts[WAITING] += 1
+        self.route(self, self.lifts_from[node], s).queue.append(s)
+        return s
+
+    def board(self, t, s):
+        self.state[s] = RIDING_LIFT
+        self.counts[WAITING] -= 1
+        self.counts[RIDING_LIFT] += 1
+
+    # Skiier `s` gets off `lift` at the top, and picks a slope down. Returns the event for reaching the bottom.
+    def leave_lift(self, t, s, lift):
+        slopes = self.slopes_from[lift.top]
+        slope = slopes[self.rng.randrange(len(slopes))] if len(slopes) > 1 else slopes[0]
+        self.state[s] = SKIING
+        self.slope[s] = slope.index
+        self.counts[RIDING_LIFT] -= 1
+        self.counts[SKIING] += 1
+        return (t + slope.length_m / self.speed[s], self.slope_done, s)
+
+    # Skiier `s` has got to the bottom of their slope, and joins the queue for one of the lifts there
+    def slope_done(self, t, s):
+        self.state[s] = WAITING
+        self.counts[SKIING] -= 1
+        self.counts[WAITING] += 1
+        self.route(self, self.lifts_from[self.slopes[self.slope[s]].bottom], s).queue.append(s)
+        return None
+
+    # The events that start each lift's chairs running, at a random point in its first chair period
+    def start_events(self):
+        return [(self.rng.random() * lift.chair_period, lift.dequeue_skiiers, None) for lift in self.lifts]
+
+# Make a synthetic mountain with `n_lifts` lifts, drawing its layout from `rng`.
+#  The first few lifts go up from the base. Each lift after that starts partway up the mountain, at the bottom of a
+#  slope from the top of a lower lift, so the lifts form a tree. From the top of each lift, one slope runs back down to
+#  the lift's own bottom, and one runs down to the bottom of some other lift at or below it, which lets skiiers move
+#  around the mountain.
+def make_mountain(resort, n_lifts, rng, chair_width=4, chair_period=7.0):
+    n_base_lifts = min(n_lifts, 3)
+    for i in range(n_lifts):
+        if i < n_base_lifts:
+            bottom = "base"
+        else:
+            bottom = "mid_%d"%(i)
+            parent = resort.lifts[rng.randrange(i)]
+            resort.add_slope("%s_to_lift_%d"%(parent.name, i), parent.top, bottom, rng.uniform(500.0, 2000.0))
+        resort.add_lift("lift_%d"%(i), bottom, "top_%d"%(i), rng.uniform(240.0, 600.0), chair_width, chair_period)
+    for lift in resort.lifts:
+        resort.add_slope("%s_home"%(lift.name), lift.top, lift.bottom, rng.uniform(1500.0, 4000.0))
+        other = resort.lifts[rng.randrange(lift.index + 1)]
+        resort.add_slope("%s_to_%s"%(lift.name, other.name), lift.top, other.bottom, rng.uniform(1500.0, 4000.0))
+    resort.validate()
+
+# `Stats` runs every `calc_every` seconds, and writes down the length of each lift queue, and the fraction of skiiers
+#  skiing. Each lift's stats are reported as a row.
+class Stats(object):
+    def __init__(self, name, resort, calc_every):
+        self.name = name
+        self.resort = resort
+        self.calc_every = calc_every
+        self.samples = 0
+        self.queue_len_sums = [0 for lift in resort.lifts]
+        self.skiiers_skiing = []
+
+    def calc_stats(self, t, _payload):
+        self.samples += 1
+        sums = self.queue_len_sums
+        for lift in self.resort.lifts:
+            sums[lift.index] += len(lift.queue)
+        self.skiiers_skiing.append(self.resort.counts[SKIING] / float(len(self.resort.speed)))
+        return [(t + self.calc_every, self.calc_stats, None)]
+
+    def rows(self):
+        resort = self.resort
+        return ["%f,%d,%f,%d,%s,%s"%(self.queue_len_sums[lift.index] / float(max(self.samples, 1)), lift.boardings,
+                                     avg(self.skiiers_skiing), len(resort.speed), lift.name, self.name)
+                for lift in resort.lifts]
+
+    def header():
+        print("avg_queue_len,boardings,skiiers_skiing,skiiers,lift,name")
+
+# Run one simulated day at a resort with `n_lifts` lifts and `n_skiiers` skiiers, who pick lifts with the routing
+#  policy called `policy`. The mountain's layout is drawn from `layout_seed`, so every policy runs on the same mountain.
+#  Returns a CSV row for each lift.
+def run_sim(n_lifts, n_skiiers, policy, max_t, layout_seed=1):
+    streams = Streams()
+    resort = Resort(routing_policies[policy], streams.stream("routes"))
+    make_mountain(resort, n_lifts, random.Random(layout_seed))
+    speeds = streams.stream("speeds")
+    for i in range(n_skiiers):
+        # Speeds are normal, like in `ski_sim.py`, but kept away from zero so nobody takes forever to get down
+        resort.add_skiier(max(0.5, speeds.normalvariate(5.0, 1.0)), "base")
+    stats = Stats(policy, resort, 60.0)
+    engine.sim_loop(max_t, [(0.0, stats.calc_stats, None)] + resort.start_events())
+    return stats.rows()
+
+# Run a day for each routing policy, in parallel (see `simlib/sweep.py`)
+def run_sims(max_t, n_lifts, n_skiiers, workers=None, seed=None):
+    Stats.header()
+    cells = [(n_lifts, n_skiiers, policy, max_t) for policy in routing_policies]
+    for rows in run_sweep(run_sim, cells, workers, seed):
+        for row in rows:
+            print(row)
+
+experiments = {
+    "routing": lambda args: run_sims(args.max_t or 8 * 3600.0, args.lifts, args.skiiers, args.workers, args.seed),
+}
+
+if __name__ == "__main__":
+    parser = cli.make_parser("Simulate skiiers moving around a network of lifts and slopes", experiments)
+    parser.add_argument("--lifts", type=int, default=20, help="Number of lifts on the mountain")
+    parser.add_argument("--skiiers", type=int, default=20000, help="Number of skiiers")
+    args = cli.parse_args(parser, experiments, ["routing"])
+    for name in args.experiments:
+        experiments[name](args)
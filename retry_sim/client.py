@@ -1,26 +1,36 @@
 import random
 import math
+import os
+import sys
 
-def net_rtt():
-    return random.expovariate(1 / 0.01)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simlib.rng import Streams
+
+# A network round trip time, drawn from `rng`
+def net_rtt(rng=random):
+    return rng.expovariate(1 / 0.01)
+
+# Each client draws the gaps between its calls from its own `arrivals` stream of `streams` (see `simlib/rng.py`),
+#  which by default is seeded from the global RNG. Network delays come from the server's `network` stream.
 
 # Client that starts calls at `rate_rps` (with exponentially distributed per-call gaps).
 #  No concurrency limit, no backoff.
 class Client(object):
-    def __init__(self, retry_strategy, rate_rps, server, stats, retry_backoff):
+    def __init__(self, retry_strategy, rate_rps, server, stats, retry_backoff, streams=None):
         self.retry_strategy = retry_strategy
+        self.arrivals = (streams or Streams()).pooled("arrivals")
         self.rate = rate_rps
         self.server = server
         self.stats = stats
         self.retry_backoff = retry_backoff
         self.drain = False
 
-    def gen_load(self, _payload, t):
+    def gen_load(self, t, _payload):
         call = Call(self.retry_strategy, self.server, self.stats, self, self.retry_backoff)
         if self.drain:
             return [] 
         else: 
-            return [(t + random.expovariate(self.rate), self.gen_load, None),
+            return [(t + self.arrivals.expovariate(self.rate), self.gen_load, None),
                     (t, call.start, None)]
 
     def done_success(self, t):
@@ -33,8 +43,9 @@ class Client(object):
 # Serial client that starts a call (approximately at `rate_rps`), but only keeps one call in flight at
 #  a time.
 class SerialClient(object):
-    def __init__(self, retry_strategy, rate_rps, server, stats, retry_backoff):
+    def __init__(self, retry_strategy, rate_rps, server, stats, retry_backoff, streams=None):
         self.retry_strategy = retry_strategy
+        self.arrivals = (streams or Streams()).pooled("arrivals")
         self.rate = rate_rps
         self.server = server
         self.stats = stats
@@ -42,31 +53,32 @@ class SerialClient(object):
         self.drain = False
         self.last_call_start = 0
 
-    def gen_load(self, _payload, t):
+    def gen_load(self, t, _payload):
         call = Call(self.retry_strategy, self.server, self.stats, self, self.retry_backoff)
         if self.drain:
             return [] 
         else:
             # Start the next call immediately if we've waited too long, or after the right delay to get the right
             #  overall rate if we haven't waited too long.
-            next_t_delay = max(0.0, random.expovariate(self.rate) - t + self.last_call_start)
+            next_t_delay = max(0.0, self.arrivals.expovariate(self.rate) - t + self.last_call_start)
             next_t = t + next_t_delay
             self.last_call_start = next_t
             return [(next_t, call.start, None)]
 
     def done_success(self, t):
-        return self.gen_load(None, t)
+        return self.gen_load(t, None)
 
     def done_failure(self, t):
-        return self.gen_load(None, t)
+        return self.gen_load(t, None)
 
 # Serial client that starts a call (approximately at `rate_rps`), but only keeps one call in flight at
 #  a time. Additionally, when it sees failures, it performs uncapped exponential backoff.
 # (Real clients will jitter their backoff. We don't do that here because our server is insensitive to load, 
 #  a somewhat unrealistic simplification in the simulation)
 class SerialClientWithBackoff(object):
-    def __init__(self, retry_strategy, rate_rps, server, stats, retry_backoff):
+    def __init__(self, retry_strategy, rate_rps, server, stats, retry_backoff, streams=None):
         self.retry_strategy = retry_strategy
+        self.arrivals = (streams or Streams()).pooled("arrivals")
         self.rate = rate_rps
         self.server = server
         self.stats = stats
@@ -75,17 +87,17 @@ class SerialClientWithBackoff(object):
         self.retry_backoff = retry_backoff
         self.drain = False
 
-    def gen_load(self, _payload, t):
+    def gen_load(self, t, _payload):
         call = Call(self.retry_strategy, self.server, self.stats, self, self.retry_backoff)
         if self.drain:
             return [] 
         else: 
-            return [(t + random.expovariate(self.rate), call.start, None)]
+            return [(t + self.arrivals.expovariate(self.rate), call.start, None)]
 
     def done_success(self, t):
         # We've seen a success. Reset the backoff to the base, and send the next call immediately
         self.current_backoff = self.base_backoff
-        return self.gen_load(None, t)
+        return self.gen_load(t, None)
 
     def done_failure(self, t):
         # We've seen a failure. Send the next call only after the backoff period, and increase the backoff
@@ -103,22 +115,22 @@ class Call(object):
         self.client = client
         self.base_backoff = base_backoff
 
-    def start(self, _payload, t):
+    def start(self, t, _payload):
         self.retry_strategy.start()
         self.stats.first_try()
-        return [(t + net_rtt(), self.server.handle, self)]
+        return [(t + net_rtt(self.server.network), self.server.handle, self)]
         
 
-    def done_success(self, _payload, t):
+    def done_success(self, t, _payload):
         self.stats.success()
         # This call was successful, inform the client
         return self.client.done_success(t)
 
-    def done_failure(self, _payload, t):
+    def done_failure(self, t, _payload):
         if self.retry_strategy.should_retry():
             self.stats.retry()
             # The call failed, but we decided to retry, so queue up another attempt with the server, and exponentially increase our backoff
-            work = [(t + net_rtt() + self.base_backoff, self.server.handle, self)]
+            work = [(t + net_rtt(self.server.network) + self.base_backoff, self.server.handle, self)]
             self.base_backoff *= 2
             return work
         else:
@@ -1,6 +1,11 @@
-import random
-import heapq
-
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simlib import cli
+from simlib.engine import EventLoop
+from simlib.rng import Streams
+from simlib.sweep import run_sweep
 from retry_strategy import AdaptiveRetryFactory, NRetriesFactory, CircuitBreakerRetryFactory
 from client import Client, SerialClient, SerialClientWithBackoff, net_rtt
 
@@ -24,107 +29,117 @@ class Stats(object):
     def success(self):
         self.successes += 1
 
+    def row(self):
+        return "%f,%f,%f,%f,%s"%(self.failure_rate, self.successes, self.total_calls, self.unique_calls, self.name)
+
     def print(self):
-        print("%f,%f,%f,%f,%s"%(self.failure_rate, self.successes, self.total_calls, self.unique_calls, self.name))
+        print(self.row())
 
     def header():
         print("failure_rate,successes,total_calls,unique_calls,name")
 
+# The server fails calls at random with probability `failure_rate`. Failures are drawn from the `failures` stream of
+#  `streams` (see `simlib/rng.py`), and the network delays of all calls from its `network` stream.
 class Server(object):
-    def __init__(self, failure_rate):
+    def __init__(self, failure_rate, streams=None):
         self.failure_rate = failure_rate
+        streams = streams or Streams()
+        self.failures = streams.pooled("failures")
+        self.network = streams.pooled("network")
 
-    def handle(self, call, t):
-        if random.random() > self.failure_rate:
-            return [(t + net_rtt(), call.done_success, None)]
+    def handle(self, t, call):
+        if self.failures.random() > self.failure_rate:
+            return [(t + net_rtt(self.network), call.done_success, None)]
         else:
-            return [(t + net_rtt(), call.done_failure, None)]
+            return [(t + net_rtt(self.network), call.done_failure, None)]
 
 def sim_loop(clients, max_t):
-    t = 0.0
-    q = [(net_rtt(), client.gen_load, None) for client in clients]
-    drain = False
-    while len(q) > 0:
-        (t, call, payload) = heapq.heappop(q)
-        q.extend(call(payload, t))
-        heapq.heapify(q)
-        # Simulation is over, tell the clients to stop sending work. This avoids a "right censoring" effect where we stop the sim with work in flight.
-        if t > max_t and not drain:
-            drain = True
-            for c in clients:
-                c.drain = True
+    loop = EventLoop([(net_rtt(client.arrivals), client.gen_load, None) for client in clients])
+    loop.run(max_t)
+    # Simulation is over, tell the clients to stop sending work, and run until all the work in flight is done. This
+    #  avoids a "right censoring" effect where we stop the sim with work in flight.
+    for c in clients:
+        c.drain = True
+    loop.run()
+
+# Run one simulation, with `n_clients` clients of type `client_type`, and return its CSV row.
+def run_sim(failure_rate, name, retry_factory, client_type, n_clients, rate_per_client, retry_backoff, max_t):
+    streams = Streams()
+    stats = Stats(failure_rate, name)
+    server = Server(failure_rate, streams.spawn("server"))
+    clients = [ client_type(retry_factory.make(), rate_per_client, server, stats, retry_backoff, streams.spawn("client_%d"%(client)))
+                for client in range(n_clients)]
+    sim_loop(clients, max_t)
+    return stats.row()
+
+# Run each of the simulations in `cells` in parallel (see `simlib/sweep.py`), and print the results in order.
+def run_cells(cells, workers, seed):
+    Stats.header()
+    for row in run_sweep(run_sim, cells, workers, seed):
+        print(row)
 
 # Simulation for "Simulating Performance" on https://brooker.co.za/blog/2022/02/28/retries.html
-def run_sims(max_t):
+def run_sims(max_t, workers=None, seed=None):
     n_clients = 100
     rate_per_client = 10.0
 
-    Stats.header()
+    cells = []
     for failure_rate in [0.0, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.0325, 0.05, 0.75, 0.1, 0.2, 0.3, 0.4, 0.5]:
         for name, retry_factory in [
                 ("no_retries", NRetriesFactory(0)),
                 ("three_retries", NRetriesFactory(3)),
                 ("adaptive_10pct", AdaptiveRetryFactory(0.1, 5)),
                 ("breaker_10pct", CircuitBreakerRetryFactory(NRetriesFactory(3), 0.1))]:
-            stats = Stats(failure_rate, name)
-            server = Server(failure_rate)
-            clients = [ Client(retry_factory.make(), rate_per_client, server, stats, 0.0) for client in range(n_clients)]
-            sim_loop(clients, max_t)
-            stats.print()
+            cells.append((failure_rate, name, retry_factory, Client, n_clients, rate_per_client, 0.0, max_t))
+    run_cells(cells, workers, seed)
 
 # Simulation for "The effect of client count" on https://brooker.co.za/blog/2022/02/28/retries.html
-def run_sims_clients(max_t):
+def run_sims_clients(max_t, workers=None, seed=None):
     rate = 100.0
 
-    Stats.header()
+    cells = []
     for n_clients in [10, 100, 1000]:
         for failure_rate in [0.0, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.0325, 0.05, 0.75, 0.1, 0.2, 0.3, 0.4, 0.5]:
             for name, retry_factory in [
                 ("adaptive_10pct_%dclients"%(n_clients), AdaptiveRetryFactory(0.1, 5)),
                 ("breaker_10pct_%dclients"%(n_clients), CircuitBreakerRetryFactory(NRetriesFactory(3), 0.1))]:
-                stats = Stats(failure_rate, name)
-                server = Server(failure_rate)
-                clients = [ Client(retry_factory.make(), rate/n_clients, server, stats, 0.0) for client in range(n_clients)]
-                sim_loop(clients, max_t)
-                stats.print()
+                cells.append((failure_rate, name, retry_factory, Client, n_clients, rate/n_clients, 0.0, max_t))
+    run_cells(cells, workers, seed)
 
-def run_sims_retry_backoff(max_t):
+def run_sims_retry_backoff(max_t, workers=None, seed=None):
     n_clients = 100
     rate_per_client = 10.0
 
-    Stats.header()
+    cells = []
     for failure_rate in [0.0, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.0325, 0.05, 0.75, 0.1, 0.2, 0.3, 0.4, 0.5]:
         for retry_backoff_name, retry_backoff in [("no", 0.0), ("large", 0.1)]:
             for name, retry_factory in [
                     ("three_retries_%s_backoff"%(retry_backoff_name), NRetriesFactory(3)),
                     ("adaptive_10pct_%s_backoff"%(retry_backoff_name), AdaptiveRetryFactory(0.1, 5))]:
-                stats = Stats(failure_rate, name)
-                server = Server(failure_rate)
-                clients = [ Client(retry_factory.make(), rate_per_client, server, stats, retry_backoff) for client in range(n_clients)]
-                sim_loop(clients, max_t)
-                stats.print()
+                cells.append((failure_rate, name, retry_factory, Client, n_clients, rate_per_client, retry_backoff, max_t))
+    run_cells(cells, workers, seed)
 
-def run_sims_retry_serial(max_t):
+def run_sims_retry_serial(max_t, workers=None, seed=None):
     n_clients = 100
     rate_per_client = 10.0
-    Stats.header()
+
+    cells = []
     for failure_rate in [0.0, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.0325, 0.05, 0.75, 0.1, 0.2, 0.3, 0.4, 0.5]:
         for client_name, client_type in [("unbounded", Client), ("100_serial", SerialClient)]:
             for name, retry_factory in [
                     ("three_retries_%s"%(client_name), NRetriesFactory(3))]:
-                stats = Stats(failure_rate, name)
-                server = Server(failure_rate)
-                clients = [ client_type(retry_factory.make(), rate_per_client, server, stats, 0.1) for client in range(n_clients)]
-                sim_loop(clients, max_t)
-                stats.print()
-
-run_sims_retry_serial(10.0)
-
-
-
-
-
-    
-
-
-
+                cells.append((failure_rate, name, retry_factory, client_type, n_clients, rate_per_client, 0.1, max_t))
+    run_cells(cells, workers, seed)
+
+experiments = {
+    "sims": lambda args: run_sims(args.max_t or 10.0, args.workers, args.seed),
+    "clients": lambda args: run_sims_clients(args.max_t or 10.0, args.workers, args.seed),
+    "retry_backoff": lambda args: run_sims_retry_backoff(args.max_t or 10.0, args.workers, args.seed),
+    "retry_serial": lambda args: run_sims_retry_serial(args.max_t or 10.0, args.workers, args.seed),
+}
+
+if __name__ == "__main__":
+    parser = cli.make_parser("Simulate clients retrying calls against a server with a fixed failure rate", experiments)
+    args = cli.parse_args(parser, experiments, ["retry_serial"])
+    for name in args.experiments:
+        experiments[name](args)
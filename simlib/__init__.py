@@ -0,0 +1 @@
+# Small library of pieces shared between the simulators in this repository.
@@ -0,0 +1,31 @@
+# Command line handling shared by the simulator scripts.
+#
+# Each script has a dict of named experiments, each of which is a function that takes the parsed arguments. Running
+#  the script with no arguments runs its default experiments, just like running it always has. Naming experiments on
+#  the command line runs just those, and the common options below override the parameters of the runs.
+import argparse
+import random
+
+# Make a parser with the options common to all the simulators. Scripts can add their own options before parsing.
+def make_parser(description, experiments):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("experiments", nargs="*", metavar="experiment",
+                        help="Experiments to run, from: %s"%(", ".join(experiments)))
+    parser.add_argument("--max-t", type=float, default=None,
+                        help="Simulated seconds per run (defaults to each experiment's own)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes to use for parameter sweeps (defaults to the number of CPUs)")
+    parser.add_argument("--seed", type=int, default=None, help="Root random seed, for reproducible runs")
+    return parser
+
+# Parse the command line, filling in `default` if no experiments were named, and seeding the global RNG if asked to.
+def parse_args(parser, experiments, default):
+    args = parser.parse_args()
+    if len(args.experiments) == 0:
+        args.experiments = default
+    for name in args.experiments:
+        if name not in experiments:
+            parser.error("unknown experiment '%s' (choose from %s)"%(name, ", ".join(experiments)))
+    if args.seed is not None:
+        random.seed(args.seed)
+    return args
@@ -0,0 +1,63 @@
+# The discrete-event engine shared by all the simulators in this repository.
+#
+# Events are `(t, callback, payload)` tuples. When an event fires the engine calls `callback(t, payload)`, and the
+#  callback returns either `None` or a list of follow-up events. Follow-up events are pushed onto the queue one at a
+#  time, so each event costs O(log n) in the size of the queue (with the default heap), rather than the O(n) it costs
+#  to re-heapify the whole queue after every event.
+#
+# In the queue, each event is stored as `(t, seq, callback, payload)`, where `seq` is a counter that increases with every
+#  event scheduled. Events that share a timestamp fire in the order they were scheduled, which makes runs reproducible,
+#  and means the queue never has to fall back to comparing callbacks or payloads.
+#
+# Pending events are kept in a scheduler from `simlib/scheduler.py`. The default is a binary heap. A calendar queue can
+#  be passed in instead, though on the simulators here it's slower (see `bench/scheduler_bench.py`).
+import itertools
+import math
+
+from simlib.scheduler import HeapScheduler
+
+class EventLoop(object):
+    def __init__(self, events=None, scheduler=None):
+        self.t = 0.0
+        self.scheduler = scheduler if scheduler is not None else HeapScheduler()
+        self.seq = itertools.count()
+        if events is not None:
+            self.schedule_all(events)
+
+    # Add a single `(t, callback, payload)` event to the queue
+    def schedule(self, event):
+        (t, call, payload) = event
+        self.scheduler.push((t, next(self.seq), call, payload))
+
+    # Add each event in `events` to the queue
+    def schedule_all(self, events):
+        for (t, call, payload) in events:
+            self.scheduler.push((t, next(self.seq), call, payload))
+
+    def __len__(self):
+        return len(self.scheduler)
+
+    # This is the core simulation loop. Until we've reached `max_t` (or run out of events), pull the next event off
+    #  the scheduler, fire whichever callback is associated with that event, and push any events it generates back
+    #  onto the scheduler. Returns the time of the last event fired. `run` can be called again to carry on from where
+    #  it stopped.
+    def run(self, max_t=math.inf):
+        scheduler = self.scheduler
+        t = self.t
+        pop = scheduler.pop
+        push = scheduler.push
+        seq = self.seq
+        while len(scheduler) > 0 and t < max_t:
+            (t, _seq, call, payload) = pop()
+            new_events = call(t, payload)
+            if new_events is not None:
+                for (new_t, new_call, new_payload) in new_events:
+                    push((new_t, next(seq), new_call, new_payload))
+        self.t = t
+        return t
+
+# Run a single simulation, starting with the events in `events`, until `max_t`.
+def sim_loop(max_t, events, scheduler=None):
+    loop = EventLoop(events, scheduler)
+    loop.run(max_t)
+    return loop
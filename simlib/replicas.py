@@ -0,0 +1,74 @@
+# Run independent replicas of a simulation until the results have converged.
+#
+# Each replica returns a list of buckets (for example, one per simulated second), and each bucket is a tuple of
+#  metrics. For every metric in every bucket we keep a streaming mean and variance, using Welford's algorithm, so
+#  nothing is kept per replica. Replicas are run in parallel batches (see `simlib/sweep.py`), and after each replica we
+#  check the 95% confidence interval of every metric. Once every half-width is below the target, we stop adding
+#  replicas, so converged cells don't keep burning CPU.
+import math
+import os
+import random
+
+from simlib.sweep import run_sweep
+
+# Two-sided 95% critical values of Student's t distribution, for 1 to 30 degrees of freedom. Beyond that, the normal
+#  distribution's 1.96 is close enough.
+t_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+def t_critical_95(df):
+    return t_95[df - 1] if df <= len(t_95) else 1.96
+
+# Streaming mean and variance (Welford, "Note on a Method for Calculating Corrected Sums of Squares and Products", 1962)
+class Welford(object):
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    # Half-width of the 95% confidence interval of the mean, or NaN with fewer than two samples
+    def half_width(self):
+        if self.n < 2:
+            return math.nan
+        return t_critical_95(self.n - 1) * math.sqrt(self.variance() / self.n)
+
+# True if every metric in every bucket has a confidence interval half-width of at most `target`
+def converged(stats, target):
+    return all(w.half_width() <= target for bucket in stats for w in bucket)
+
+# Run `replica_fn(*args)` in batches of `batch_size` (by default, one per CPU) until at least `min_replicas` have run
+#  and every metric has converged to within `target_half_width`, or `max_replicas` have run.
+# Results are folded in one replica at a time, in replica order, and we stop at the first replica where everything has
+#  converged, throwing away the rest of its batch. So the stopping point and the results only depend on the seed, not
+#  on the batch size, the number of workers, or the number of CPUs.
+# Returns the per-bucket list of `Welford`s for each metric, and the number of replicas used.
+def run_replicas(replica_fn, args, target_half_width, min_replicas=10, max_replicas=1000, batch_size=None,
+                 workers=None, seed=None):
+    if seed is None:
+        seed = random.randrange(2**32)
+    if batch_size is None:
+        batch_size = workers or os.cpu_count() or 1
+    stats = []
+    n = 0
+    while n < max_replicas:
+        size = min(max(batch_size, min_replicas - n), max_replicas - n)
+        for buckets in run_sweep(replica_fn, [args] * size, workers, seed, start_index=n):
+            for j, values in enumerate(buckets):
+                if j >= len(stats):
+                    stats.append([Welford() for v in values])
+                for w, v in zip(stats[j], values):
+                    w.add(v)
+            n += 1
+            if n >= min_replicas and converged(stats, target_half_width):
+                return (stats, n)
+    return (stats, n)
@@ -0,0 +1,44 @@
+# Seeded random number streams, one per simulation component.
+#
+# If every component draws from the global `random` module, a change to one component (like the queue discipline)
+#  shifts the numbers every other component sees, and two runs can't be compared draw for draw. Instead, each
+#  simulation gets a `Streams` with a root seed, and each component (arrivals, service times, the network, ...) asks it
+#  for its own named generator. Each stream's seed is derived from the root seed and the stream's name, so a
+#  component's draws only depend on the root seed, whatever the other components do, and whichever process runs it.
+#
+# `spawn` makes a child `Streams` for a sub-simulation, like numpy's `SeedSequence.spawn`, but keyed by name rather
+#  than by spawn order. Most of the simulators use the standard library's `random.Random`; `numpy` makes a numpy
+#  `Generator` for the ones that draw in bulk.
+#
+# With no root seed, one is drawn from the global `random` module, which is seeded by `--seed` (see `simlib/cli.py`)
+#  and per cell in sweeps (see `simlib/sweep.py`), so runs stay reproducible.
+import random
+
+from simlib.variates import PooledRandom
+
+class Streams(object):
+    def __init__(self, seed=None, name=""):
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.name = name
+
+    # A child `Streams` for the part of the simulation called `name`
+    def spawn(self, name):
+        return Streams(self.seed, "%s/%s"%(self.name, name))
+
+    # A `random.Random` for the component called `name`
+    def stream(self, name):
+        return random.Random("%d:%s/%s"%(self.seed, self.name, name))
+
+    # A numpy `Generator` for the component called `name`
+    def numpy(self, name):
+        import numpy
+        return numpy.random.default_rng(numpy.random.SeedSequence(self.stream(name).getrandbits(128)))
+
+    # A stream for the component called `name` that draws its variates in blocks (see `simlib/variates.py`), for hot
+    #  sampling paths. Without numpy, this is just `stream(name)`.
+    def pooled(self, name):
+        try:
+            generator = self.numpy(name)
+        except ImportError:
+            return self.stream(name)
+        return PooledRandom(generator)
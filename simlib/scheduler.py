@@ -0,0 +1,123 @@
+# Schedulers hold the pending events for the event loop in `simlib/engine.py`.
+#
+# A scheduler stores `(t, seq, callback, payload)` entries, and has three operations: `push(entry)`, `pop()` (which
+#  removes and returns the entry with the smallest `(t, seq)`), and `len()`. Because `seq` is unique, entries are
+#  totally ordered, and every scheduler pops events in exactly the same order. That means the choice of scheduler
+#  only changes how fast a simulation runs, never its results.
+import bisect
+import heapq
+from functools import partial
+
+# A binary heap. O(log n) push and pop, and a good default for most simulations.
+class HeapScheduler(object):
+    def __init__(self):
+        self.q = []
+        # Bind the heapq functions directly, so that push and pop don't pay for an extra Python-level call
+        self.push = partial(heapq.heappush, self.q)
+        self.pop = partial(heapq.heappop, self.q)
+
+    def __len__(self):
+        return len(self.q)
+
+    def name(self):
+        return "heap"
+
+# A calendar queue (R. Brown, "Calendar Queues: A Fast O(1) Priority Queue Implementation for the Simulation Event
+#  Set Problem", CACM 1988).
+#
+# Time is divided into "days" of `width` seconds, and the calendar has `n` buckets, one for each day of the "year".
+#  An event at time `t` goes into bucket `int(t / width) % n`, where it's kept in sorted order. To pop, we walk
+#  forward a day at a time from the current day, looking for a bucket whose first event falls within that day.
+# When the width is about the same as the gap between events, buckets hold one or two events each, and both push
+#  and pop are amortized O(1). The number of buckets doubles or halves as the queue grows or shrinks, and the width
+#  is re-estimated from the events at the front of the queue each time it does.
+class CalendarQueue(object):
+    def __init__(self, n_buckets=2, width=1.0):
+        self.size = 0
+        self._setup(n_buckets, width, 0.0)
+
+    def __len__(self):
+        return self.size
+
+    def name(self):
+        return "calendar"
+
+    def _setup(self, n_buckets, width, start_t):
+        self.n = n_buckets
+        self.width = width
+        self.inv_width = 1.0 / width
+        self.buckets = [[] for i in range(n_buckets)]
+        self.day = int(start_t * self.inv_width)
+        self.grow_at = 2 * n_buckets
+        self.shrink_at = n_buckets // 2 - 2
+
+    def push(self, entry):
+        t = entry[0]
+        day = int(t * self.inv_width)
+        # Events are almost never scheduled in the past, but if one is, move the calendar back so it's found in order
+        if day < self.day:
+            self.day = day
+        bucket = self.buckets[day % self.n]
+        if len(bucket) == 0 or bucket[-1] < entry:
+            bucket.append(entry)
+        else:
+            bisect.insort(bucket, entry)
+        self.size += 1
+        if self.size > self.grow_at:
+            self._resize(2 * self.n)
+
+    def pop(self):
+        if self.size == 0:
+            raise IndexError("pop from empty CalendarQueue")
+        buckets = self.buckets
+        n = self.n
+        inv_width = self.inv_width
+        day = self.day
+        for i in range(n):
+            bucket = buckets[day % n]
+            if len(bucket) > 0 and bucket[0][0] * inv_width < day + 1:
+                self.day = day
+                return self._take(bucket)
+            day += 1
+        # We went a whole year without finding anything, so the events are sparse. Fall back to a direct search for
+        #  the earliest event, and jump the calendar to its day.
+        bucket = min((b for b in buckets if len(b) > 0), key=lambda b: b[0])
+        self.day = int(bucket[0][0] * inv_width)
+        return self._take(bucket)
+
+    def _take(self, bucket):
+        entry = bucket.pop(0)
+        self.size -= 1
+        if self.size < self.shrink_at:
+            self._resize(self.n // 2)
+        return entry
+
+    # Rebuild the calendar with `n_buckets` buckets, and a day width estimated from the spacing of the earliest events.
+    def _resize(self, n_buckets):
+        entries = sorted(e for bucket in self.buckets for e in bucket)
+        width = self._estimate_width(entries)
+        start_t = entries[0][0] if len(entries) > 0 else self.day * self.width
+        self._setup(n_buckets, width, start_t)
+        for entry in entries:
+            self.buckets[int(entry[0] * self.inv_width) % self.n].append(entry)
+
+    # Following Brown, take the mean gap between the first few events, recalculate it ignoring gaps more than twice
+    #  that size, and make each day three times that long.
+    def _estimate_width(self, entries):
+        sample = [entries[i + 1][0] - entries[i][0] for i in range(min(len(entries), 25) - 1)]
+        if len(sample) == 0:
+            return self.width
+        mean_gap = sum(sample) / len(sample)
+        close = [gap for gap in sample if gap <= 2.0 * mean_gap]
+        if len(close) > 0:
+            mean_gap = sum(close) / len(close)
+        if mean_gap <= 0.0:
+            return self.width
+        return 3.0 * mean_gap
+
+# Schedulers by name, for `bench/scheduler_bench.py`. The simulators themselves always use the default heap: none of
+#  their command lines pick a scheduler, and on the nudge and omission workloads the calendar queue is slower.
+schedulers = {
+    "heap": HeapScheduler,
+    "calendar": CalendarQueue,
+}
@@ -0,0 +1,200 @@
+# Buffered, columnar output for per-event simulation results.
+#
+# Formatting and writing a CSV line for every completed job can easily cost more than simulating the job. Instead,
+#  simulators append each value to a preallocated `array('d')` column, and the sink formats and writes whole columns
+#  at a time when it's flushed.
+#
+# A `ResultSink` has a list of output columns. Some of those columns are constant for a whole run (like the name of
+#  the simulation), and are passed as labels when making a `Table` for that run. The rest are recorded per event. To
+#  keep recording cheap, simulators grab the `append` methods of the columns up front with `Table.appenders`, so
+#  recording a result is one method call per column.
+#
+# The output format comes from the file name: `.npy` (needs numpy) and `.parquet` (needs pyarrow) files are written
+#  in one go when the sink is closed, and anything else is written as CSV, which is flushed a table at a time. `-` is
+#  CSV on stdout, and an open file object (like an `io.StringIO`) is written as CSV. Pass `header=False` to leave out
+#  the CSV header, for example when joining the output of several sinks.
+#
+# Sinks can also summarize columns with streaming quantile sketches (see `simlib/sketch.py`). The summary, with the
+#  count, p50, p99, p99.9 and max of each summarized column for each table, is written as CSV to `summary_out` when
+#  the sink is closed. With `out=None`, the raw per-event results aren't kept at all: summarized columns go straight
+#  into their sketches, other columns are dropped, and memory use stays constant however long the run is.
+import sys
+from array import array
+
+from simlib.sketch import DDSketch
+
+summary_quantiles = [("p50", 0.5), ("p99", 0.99), ("p999", 0.999)]
+
+# The columns of a summary, for tables with the label columns `labels`
+def summary_columns(labels):
+    return labels + ["column", "count"] + [q for q, _ in summary_quantiles] + ["max"]
+
+# Appender for columns that aren't being kept
+def discard(_v):
+    pass
+
+class Table(object):
+    def __init__(self, sink, labels):
+        for name in labels:
+            if name not in sink.columns:
+                raise ValueError("unknown label column '%s'"%(name))
+        self.labels = labels
+        self.fields = [name for name in sink.columns if name not in labels]
+        self.columns = [array('d') for name in self.fields]
+        self.row_format = self._row_format(sink)
+        self.raw = sink.format is not None
+        self.sketches = {name: DDSketch() for name in sink.summarize}
+        # How many of the buffered rows have been added to the sketches
+        self.summarized = 0
+
+    # Return the appenders for the columns called `names`, in that order. These are the bound `append` methods of the
+    #  columns, unless raw results are off, when they go straight to the sketches (or nowhere).
+    def appenders(self, *names):
+        for name in names:
+            if name not in self.fields:
+                raise ValueError("unknown column '%s'"%(name))
+        if self.raw:
+            return [self.columns[self.fields.index(name)].append for name in names]
+        return [self.sketches[name].add if name in self.sketches else discard for name in names]
+
+    def __len__(self):
+        return len(self.columns[0]) if len(self.columns) > 0 else 0
+
+    # Remove all the buffered rows. The columns are cleared in place, so appenders stay valid.
+    def clear(self):
+        self.summarize()
+        for column in self.columns:
+            del column[:]
+        self.summarized = 0
+
+    # Add any buffered rows that haven't been seen yet to the sketches
+    def summarize(self):
+        for name, sketch in self.sketches.items():
+            column = self.columns[self.fields.index(name)]
+            sketch.add_all(column[self.summarized:])
+        self.summarized = len(self)
+
+    def write_csv(self, f):
+        if len(self) > 0:
+            f.write("".join(map(self.row_format.__mod__, zip(*self.columns))))
+
+    # The labels are formatted once, into a format string that takes just the per-event columns
+    def _row_format(self, sink):
+        parts = []
+        for name in sink.columns:
+            if name in self.labels:
+                parts.append(sink.format_label(name, self.labels[name]).replace("%", "%%"))
+            else:
+                parts.append(sink.formats.get(name, "%f"))
+        return ",".join(parts) + "\n"
+
+class ResultSink(object):
+    def __init__(self, out, columns, formats=None, header=True, summarize=(), summary_out=None):
+        self.columns = columns
+        self.formats = formats if formats is not None else {}
+        self.header = header
+        self.summarize = summarize
+        self.summary_out = summary_out
+        self.tables = []
+        self.path = None
+        self.close_file = False
+        if out is None:
+            self.format = None
+        elif not isinstance(out, str):
+            self.format = "csv"
+            self.file = out
+        elif out == "-":
+            self.format = "csv"
+            self.file = sys.stdout
+        else:
+            self.path = out
+            self.format = "npy" if out.endswith(".npy") else "parquet" if out.endswith(".parquet") else "csv"
+            if self.format == "csv":
+                self.file = open(out, "w")
+                self.close_file = True
+        if self.format == "csv" and header:
+            self.file.write(",".join(columns) + "\n")
+
+    def format_label(self, name, value):
+        return self.formats.get(name, "%s" if isinstance(value, str) else "%f")%(value,)
+
+    # Start a new table of results, where each of `labels` is a column with a constant value
+    def table(self, **labels):
+        table = Table(self, labels)
+        self.tables.append(table)
+        return table
+
+    # Write out any buffered CSV rows. Tables can carry on recording after a flush. Binary formats are written in one
+    #  go by `close`.
+    def flush(self):
+        if self.format == "csv":
+            for table in self.tables:
+                table.write_csv(self.file)
+                table.clear()
+            self.file.flush()
+
+    def close(self):
+        if self.format == "csv":
+            self.flush()
+            if self.close_file:
+                self.file.close()
+        elif self.format == "npy":
+            self._write_npy()
+        elif self.format == "parquet":
+            self._write_parquet()
+        if len(self.summarize) > 0:
+            self._write_summary()
+        self.tables = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self.close()
+
+    # Join all the tables into one list of values per output column, with labels repeated to fill each table
+    def _joined_columns(self):
+        joined = {name: [] for name in self.columns}
+        for table in self.tables:
+            n = len(table)
+            for name in self.columns:
+                if name in table.labels:
+                    joined[name].extend([table.labels[name]] * n)
+                else:
+                    joined[name].extend(table.columns[table.fields.index(name)])
+        return joined
+
+    def _write_summary(self):
+        for table in self.tables:
+            table.summarize()
+        if self.summary_out is None or self.summary_out == "-":
+            self._write_summary_csv(sys.stdout)
+        elif isinstance(self.summary_out, str):
+            with open(self.summary_out, "w") as f:
+                self._write_summary_csv(f)
+        else:
+            self._write_summary_csv(self.summary_out)
+
+    # One row for each summarized column of each table
+    def _write_summary_csv(self, f):
+        labels = [name for name in self.columns if len(self.tables) > 0 and name in self.tables[0].labels]
+        if self.header:
+            f.write(",".join(summary_columns(labels)) + "\n")
+        for table in self.tables:
+            for name, sketch in table.sketches.items():
+                values = [self.format_label(label, table.labels[label]) for label in labels] + [name, str(sketch.count)]
+                values += ["%f"%(sketch.quantile(q)) for _, q in summary_quantiles] + ["%f"%(sketch.max)]
+                f.write(",".join(values) + "\n")
+
+    def _write_npy(self):
+        import numpy
+        joined = self._joined_columns()
+        arrays = [numpy.array(joined[name]) for name in self.columns]
+        records = numpy.rec.fromarrays(arrays, names=self.columns)
+        numpy.save(self.path, records)
+
+    def _write_parquet(self):
+        import pyarrow
+        import pyarrow.parquet
+        joined = self._joined_columns()
+        pyarrow.parquet.write_table(pyarrow.table(joined), self.path)
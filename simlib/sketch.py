@@ -0,0 +1,65 @@
+# A streaming quantile sketch, following DDSketch (Masson, Rim and Lee, "DDSketch: A Fast and Fully-Mergeable Quantile
+#  Sketch with Relative-Error Guarantees", VLDB 2019).
+#
+# Values are counted in logarithmically-sized buckets, where bucket `i` holds values in (gamma^(i-1), gamma^i], and
+#  gamma = (1 + alpha) / (1 - alpha). Every quantile the sketch returns is within a factor of `alpha` (relative) of
+#  the true value, and the number of buckets only grows with the log of the range of the values, so memory is
+#  effectively constant no matter how many values are added. The minimum, maximum and count are tracked exactly.
+#
+# Latencies of zero (or a hair below it, from floating point error) go into a separate zero bucket.
+import math
+
+class DDSketch(object):
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self.inv_log_gamma = 1.0 / math.log(self.gamma)
+        self.min_value = min_value
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, v):
+        self.count += 1
+        if v > self.max:
+            self.max = v
+        if v < self.min:
+            self.min = v
+        if v > self.min_value:
+            i = math.ceil(math.log(v) * self.inv_log_gamma)
+            self.bins[i] = self.bins.get(i, 0) + 1
+        else:
+            self.zero_count += 1
+
+    def add_all(self, values):
+        for v in values:
+            self.add(v)
+
+    # Fold the counts from `other` (which must have the same accuracy) into this sketch
+    def merge(self, other):
+        assert other.gamma == self.gamma
+        for i, n in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    # Return an estimate of the `q` quantile (0 <= q <= 1), or NaN if the sketch is empty
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        if q >= 1.0:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > rank:
+                # The middle of the bucket (in the relative sense), clamped to the values we've actually seen
+                return min(max(2.0 * self.gamma ** i / (self.gamma + 1.0), self.min), self.max)
+        return self.max
@@ -0,0 +1,32 @@
+# Run a parameter sweep, fanning the independent cells out across a pool of processes.
+#
+# A sweep is a cell function and a list of cells, where each cell is a tuple of arguments for the cell function. The
+#  cell function runs one simulation and returns its results (typically CSV rows). Results are returned in the same
+#  order as `cells`, no matter which worker finishes first, so the output matches a serial run.
+#
+# Each cell seeds the global `random` module from the sweep's root seed and the cell's index before it runs. That
+#  makes each cell's results independent of which worker ran it, or what ran before it in that worker.
+#
+# The cell function must be picklable, which means defining it at the top level of a module.
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+# Seed the global RNG for cell `index`, then run it
+def run_cell(cell_fn, args, seed, index):
+    random.seed("%d:%d"%(seed, index))
+    return cell_fn(*args)
+
+# Run `cell_fn(*args)` for each `args` in `cells`, returning a list of the results in order.
+#  `workers` is the number of processes to use (defaulting to the number of CPUs). With `workers=1`, the cells are run
+#  one at a time in this process, which is useful for debugging and profiling.
+#  `seed` is the root seed for the sweep. If it's `None`, a root seed is picked at random.
+#  `start_index` is the index of the first cell, for seeding, which lets a sweep be run in several batches.
+def run_sweep(cell_fn, cells, workers=None, seed=None, start_index=0):
+    cells = list(cells)
+    if seed is None:
+        seed = random.randrange(2**32)
+    indexes = range(start_index, start_index + len(cells))
+    if workers == 1:
+        return [run_cell(cell_fn, args, seed, i) for i, args in zip(indexes, cells)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_cell, [cell_fn] * len(cells), cells, [seed] * len(cells), indexes))
@@ -0,0 +1,55 @@
+# Trace-driven workloads, read from binary files a chunk at a time.
+#
+# A trace is a set of equal-length columns, like arrival times, job sizes, or cache keys. The file is memory-mapped
+#  with numpy, and read `chunk_size` rows at a time, so only one chunk is ever in memory: traces many times bigger
+#  than memory can be replayed with constant memory use.
+#
+# Two file layouts are supported:
+#  `.npy`: A structured array with a field for each column (like the `.npy` files written by `simlib/sink.py`), or a
+#    plain one-dimensional array if the trace has one column.
+#  Anything else: Raw values of type `dtype`, column by column, so the first column is the first `n` values, the
+#    second column the next `n`, and so on.
+#
+# Needs numpy.
+
+# Write the columns in `columns` (a dict of name to sequence of values) to `path` as a `.npy` trace
+def write_trace(path, columns):
+    import numpy
+    arrays = [numpy.asarray(values) for values in columns.values()]
+    numpy.save(path, numpy.rec.fromarrays(arrays, names=list(columns)))
+
+class TraceSource(object):
+    def __init__(self, path, columns, dtype="<f8", chunk_size=65536):
+        import numpy
+        self.columns = columns
+        self.chunk_size = chunk_size
+        if path.endswith(".npy"):
+            data = numpy.load(path, mmap_mode="r")
+            if data.dtype.names is None:
+                if len(columns) != 1:
+                    raise ValueError("%s has no named fields, so it can only be read as one column"%(path))
+                self.arrays = [data]
+            else:
+                for name in columns:
+                    if name not in data.dtype.names:
+                        raise ValueError("%s has no column '%s'"%(path, name))
+                self.arrays = [data[name] for name in columns]
+        else:
+            data = numpy.memmap(path, dtype=dtype, mode="r")
+            if len(data) % len(columns) != 0:
+                raise ValueError("%s doesn't hold %d equal-length columns"%(path, len(columns)))
+            self.arrays = list(data.reshape(len(columns), -1))
+
+    def __len__(self):
+        return len(self.arrays[0])
+
+    # Yield a tuple of lists, one for each column, for each chunk of up to `chunk_size` rows (by default, the source's)
+    def chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.chunk_size
+        for start in range(0, len(self), chunk_size):
+            yield tuple(array[start:start + chunk_size].tolist() for array in self.arrays)
+
+    # Yield a tuple of values for each row
+    def rows(self):
+        for chunk in self.chunks():
+            yield from zip(*chunk)
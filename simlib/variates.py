@@ -0,0 +1,61 @@
+# Pools of random variates, drawn from numpy in blocks and handed out one at a time.
+#
+# Drawing one variate from the standard library costs a few Python-level operations per draw. Drawing a block of them
+#  with numpy costs a few nanoseconds each, and handing them out of a list is one `pop`. The pools here refill from a
+#  numpy `Generator` (see `simlib/rng.py`), so pooled runs are just as reproducible as unpooled ones.
+#
+# Blocks start small and double on each refill, up to `block_size`. Some simulations have thousands of components that
+#  each only draw a handful of variates, and a full block for each would waste memory and time.
+import random
+
+first_block_size = 256
+block_size = 65536
+
+# A pool of variates from any distribution. `draw(n)` returns a numpy array of `n` variates.
+class VariatePool(object):
+    def __init__(self, draw, block_size=block_size):
+        self.draw = draw
+        self.block_size = block_size
+        self.next_block_size = min(first_block_size, block_size)
+        self.values = []
+
+    def refill(self):
+        self.values = self.draw(self.next_block_size).tolist()
+        self.next_block_size = min(self.next_block_size * 2, self.block_size)
+        return self.values
+
+    def next(self):
+        values = self.values
+        if not values:
+            values = self.refill()
+        return values.pop()
+
+# A stand-in for the methods of `random.Random` that the simulators use, with each method backed by a pool of standard
+#  variates drawn from the numpy `Generator` `generator`, which are then scaled. The methods check their pool inline,
+#  rather than calling `VariatePool.next`, to save a call per draw.
+# `random.Random.random` is already a single C call, which is faster than any pool, so uniform variates come from a
+#  `random.Random` seeded from `generator`.
+class PooledRandom(object):
+    def __init__(self, generator, block_size=block_size):
+        self.random = random.Random(int(generator.integers(2**63))).random
+        self.exponential = VariatePool(generator.standard_exponential, block_size)
+        self.normal = VariatePool(generator.standard_normal, block_size)
+
+    def expovariate(self, lambd):
+        values = self.exponential.values
+        if not values:
+            values = self.exponential.refill()
+        return values.pop() / lambd
+
+    # Weibull with scale `alpha` and shape `beta`, from the inverse CDF of a standard exponential
+    def weibullvariate(self, alpha, beta):
+        values = self.exponential.values
+        if not values:
+            values = self.exponential.refill()
+        return alpha * values.pop() ** (1.0 / beta)
+
+    def normalvariate(self, mu, sigma):
+        values = self.normal.values
+        if not values:
+            values = self.normal.refill()
+        return mu + sigma * values.pop()
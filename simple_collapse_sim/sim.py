@@ -10,10 +10,16 @@
 #   Process       └┤   times)   │       │ with concurrency)  │
 #                  └────────────┘       └────────────────────┘
 
+import os
 import random
-import heapq
+import sys
 from dataclasses import dataclass
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simlib import cli, engine
+from simlib.replicas import run_replicas
+from simlib.rng import Streams
+
 network_delay = 0.1
 max_request_t = 3.0
 base_server_time = 1.0
@@ -23,14 +29,15 @@ server_concurrency_slope = 0.01
 def avg(v):
     return sum(v) / len(v)
 
-# Simulate a network delay between the client and the server
-def netdelay(t):
-    return t + random.expovariate(1.0/network_delay)
+# Simulate a network delay between the client and the server, drawn from `rng`
+def netdelay(t, rng=random):
+    return t + rng.expovariate(1.0/network_delay)
 
 # Clients try to make a single request against the server. If that request doesn't succeed withing `max_request_t` they
 #  retry it up to 3 times.
+# Network delays are drawn from the server's `network` stream (see `simlib/rng.py`), and any jitter from `rng`.
 class Client(object):
-    def __init__(self, stats, server):
+    def __init__(self, stats, server, rng=random):
         self.retries_left = 3
         self.current_try = 0
         self.server = server
@@ -39,7 +46,7 @@ class Client(object):
     # Send a request to the server, and set up the timeout
     def send_req(self, t, extra_delay):
         return [(t + max_request_t + extra_delay, self.timeout, (self.current_try,)),
-            (netdelay(t) + extra_delay, self.server.start, (self, self.current_try))]
+            (netdelay(t, self.server.network) + extra_delay, self.server.start, (self, self.current_try))]
     
     def send_new_req(self, t):
         self.stats.start()
@@ -72,23 +79,26 @@ class Client(object):
 
 # Implementation of client that implements exponential backoff and jitter        
 class ClientWithBackoffAndJitter(Client):
-    def __init__(self, stats, server):
-        super().__init__(stats, server)
+    def __init__(self, stats, server, rng=random):
+        super().__init__(stats, server, rng)
         self.backoff_time = 10.0
+        self.rng = rng
 
     # Retry wait with exponential backoff and Jitter
     def retry_wait(self):
         self.backoff_time *= 2
-        return random.random() * self.backoff_time
+        return self.rng.random() * self.backoff_time
 
 
 # The server processes requests as they come in, sending a response after some delay.
 # The delay is calculated with a simple linear model: some base response time, plus an additional time linear in the number
 #  of in-flight requests.
 # This is intended to (very roughly) simulate the cooordination and coherence costs that become more costly as concurrency increases.
+# The network delays of every request and response are drawn from the `network` stream of `streams`.
 class Server(object):
-    def __init__(self):
+    def __init__(self, streams=None):
         self.concurrency = 0
+        self.network = (streams or Streams()).pooled("network")
 
     def start(self, t, data):
         self.concurrency += 1
@@ -96,28 +106,33 @@ class Server(object):
     
     def end(self, t, data):
         self.concurrency -= 1
-        return [(netdelay(t), data[0].done, data)]
+        return [(netdelay(t, self.network), data[0].done, data)]
+
+# The load generators draw arrivals from the `arrivals` stream of `streams`, and give each client the `jitter` stream.
 
 # Generate a Poisson arrival process with a base rate that ramps up linearly to some peak, then ramps back down at the same rate
 class RampUpDownLoadGenerator(object):
-    def __init__(self, stats, server, client_type, base_rate, slope, peak_t):
+    def __init__(self, stats, server, client_type, base_rate, slope, peak_t, streams=None):
         self.stats = stats
         self.server = server
         self.base_rate = base_rate
         self.slope = slope
         self.peak_t = peak_t
         self.client_type = client_type
+        streams = streams or Streams()
+        self.arrivals = streams.pooled("arrivals")
+        self.jitter = streams.stream("jitter")
 
     def gen_load(self, t, _data):
-        rsp = self.client_type(self.stats, self.server).send_new_req(t)
+        rsp = self.client_type(self.stats, self.server, self.jitter).send_new_req(t)
         rate = self.base_rate - self.slope * abs(t - self.peak_t)
         if rate > 0:
-            rsp.append((t + random.expovariate(rate), self.gen_load, None))
+            rsp.append((t + self.arrivals.expovariate(rate), self.gen_load, None))
         return rsp
     
 # Generate a Poisson arrival process that continues at a constant rate, spikes up to a new rate for a fixed time, then drops back down
 class SpikeLoadGenerator(object):
-    def __init__(self, stats, server, client_type, base_rate, peak_rate, spike_start, spike_width):
+    def __init__(self, stats, server, client_type, base_rate, peak_rate, spike_start, spike_width, streams=None):
         self.stats = stats
         self.server = server
         self.base_rate = base_rate
@@ -125,13 +140,16 @@ class SpikeLoadGenerator(object):
         self.spike_start = spike_start
         self.spike_width = spike_width
         self.client_type = client_type
+        streams = streams or Streams()
+        self.arrivals = streams.pooled("arrivals")
+        self.jitter = streams.stream("jitter")
 
     def gen_load(self, t, _data):
-        rsp = self.client_type(self.stats, self.server).send_new_req(t)
+        rsp = self.client_type(self.stats, self.server, self.jitter).send_new_req(t)
         if t < self.spike_start or t > self.spike_start + self.spike_width:
-            rsp.append((t + random.expovariate(self.base_rate), self.gen_load, None))
+            rsp.append((t + self.arrivals.expovariate(self.base_rate), self.gen_load, None))
         else:
-            rsp.append((t + random.expovariate(self.peak_rate), self.gen_load, None))
+            rsp.append((t + self.arrivals.expovariate(self.peak_rate), self.gen_load, None))
         return rsp
 
 @dataclass
@@ -184,59 +202,87 @@ class Stats(object):
         return [(t + 1.0, self.print_stats, None)]
 
 # Run the simulation with the RampUpDownLoadGenerator, which ramps up at a constant slope to a peak rate, then ramps back down
-def run_sim_ramp(run_name, client_type):
-    max_t = 80
-    server = Server()
+def run_sim_ramp(run_name, client_type, max_t=80):
+    streams = Streams()
+    server = Server(streams.spawn("server"))
     stats = Stats(server, run_name)
-    gen = RampUpDownLoadGenerator(stats, server, client_type, 80, 1.6, 25)
+    gen = RampUpDownLoadGenerator(stats, server, client_type, 80, 1.6, 25, streams.spawn("load"))
     q = [(1.0, stats.print_stats, None), (0.01, gen.gen_load, None)]
     sim_loop(max_t, q)
     return stats.history
 
 # Run the simulation with the SpikeLoadGenerator, which has a constant rate, spikes up to a new rate, then drops back down
-def run_sim_spike(run_name, client_type):
-    max_t = 80
-    server = Server()
+def run_sim_spike(run_name, client_type, max_t=80):
+    streams = Streams()
+    server = Server(streams.spawn("server"))
     stats = Stats(server, run_name)
-    gen = SpikeLoadGenerator(stats, server, client_type, 40, 80, 20, 5)
+    gen = SpikeLoadGenerator(stats, server, client_type, 40, 80, 20, 5, streams.spawn("load"))
     q = [(1.0, stats.print_stats, None), (0.01, gen.gen_load, None)]
     sim_loop(max_t, q)
     return stats.history
 
 # Run the same simulation `num_runs` times, and print out the average value at each stat point in each second
-def run_multiple_and_average_stats(run_name, client_type, sim_fn, num_runs):
+def run_multiple_and_average_stats(run_name, client_type, sim_fn, num_runs, max_t=80):
     stats = []
     for i in range(num_runs):
-        for j, second_stat in enumerate(sim_fn(run_name, client_type)):
+        for j, second_stat in enumerate(sim_fn(run_name, client_type, max_t)):
             if j >= len(stats):
                 stats.append([])
             stats[j].append(second_stat)
     for data in stats:
         stat_data_average(data).print_csv()
 
-# Run a single simulation.        
+# Run one replica of `sim_fn`, returning the (starts, successes, retries, timeouts) in each second. This only returns
+#  numbers, so it's cheap to send back from a worker process.
+def run_replica(run_name, client_type, sim_fn, max_t):
+    return [(d.starts, d.successes, d.retries, d.timeouts) for d in sim_fn(run_name, client_type, max_t)]
+
+def ci_header():
+    print("t, starts, starts_ci, successes, successes_ci, retries, retries_ci, timeouts, timeouts_ci, replicas, run_name")
+
+# Run replicas of the same simulation in parallel until the 95% confidence interval half-width of every stat in every
+#  second is at most `ci_target` (or `max_replicas` have run), then print the mean and half-width of each stat.
+def run_replicas_with_ci(run_name, client_type, sim_fn, ci_target, min_replicas, max_replicas, max_t=80, workers=None, seed=None):
+    stats, n = run_replicas(run_replica, (run_name, client_type, sim_fn, max_t), ci_target, min_replicas, max_replicas,
+                            workers=workers, seed=seed)
+    for j, bucket in enumerate(stats):
+        print(",".join(["%f"%(float(j))] + ["%f,%f"%(w.mean, w.half_width()) for w in bucket] + [str(n), run_name]))
+
+# Run a single simulation.
 def sim_loop(max_t, q):
-    t = 0.0
-    heapq.heapify(q)
-    # This is the core simulation loop. Until we've reached the maximum simulation time, pull the next event off
-    #  from a heap of events, fire whichever callback is associated with that event, and add any events it generates
-    #  back to the heap.
-    while len(q) > 0 and t < max_t:
-        # Get the next event. Because `q` is a heap, we can just pop this off the front of the heap.
-        (t, call, payload) = heapq.heappop(q)
-        #print(t)
-        # Execute the callback associated with this event
-        new_events = call(t, payload)
-        # If the callback returned any follow-up events, add them to the event queue `q` and make sure its still a valid heap
-        if new_events is not None:
-            q.extend(new_events)
-            heapq.heapify(q)
+    engine.sim_loop(max_t, q)
 
 run_multiple_n = 10
 
-StatData.header()
-run_multiple_and_average_stats("ramp_no_backoff", Client, run_sim_ramp, run_multiple_n)
-run_multiple_and_average_stats("ramp_backoff_and_jitter", ClientWithBackoffAndJitter, run_sim_ramp, run_multiple_n)
+# An experiment that runs `sim_fn` with clients of type `client_type` and prints the average over the replicas. With
+#  `--ci-target`, replicas are run in parallel until they converge, and the confidence intervals are printed too.
+def averaged_experiment(run_name, client_type, sim_fn):
+    def experiment(args):
+        if args.ci_target is None:
+            run_multiple_and_average_stats(run_name, client_type, sim_fn, args.replicas, args.max_t or 80)
+        else:
+            run_replicas_with_ci(run_name, client_type, sim_fn, args.ci_target, args.replicas, args.max_replicas,
+                                 args.max_t or 80, args.workers, args.seed)
+    return experiment
+
+experiments = {
+    "ramp_no_backoff": averaged_experiment("ramp_no_backoff", Client, run_sim_ramp),
+    "ramp_backoff_and_jitter": averaged_experiment("ramp_backoff_and_jitter", ClientWithBackoffAndJitter, run_sim_ramp),
+    "spike_no_backoff": averaged_experiment("spike_no_backoff", Client, run_sim_spike),
+    "spike_backoff_and_jitter": averaged_experiment("spike_backoff_and_jitter", ClientWithBackoffAndJitter, run_sim_spike),
+}
 
-run_multiple_and_average_stats("spike_no_backoff", Client, run_sim_spike, run_multiple_n)
-run_multiple_and_average_stats("spike_backoff_and_jitter", ClientWithBackoffAndJitter, run_sim_spike, run_multiple_n)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = cli.make_parser("Simulate clients with timeouts and retries against a server that slows with concurrency", experiments)
+    parser.add_argument("--replicas", type=int, default=run_multiple_n,
+                        help="Number of runs to average over (the minimum number, with --ci-target)")
+    parser.add_argument("--ci-target", type=float, default=None,
+                        help="Keep adding replicas until the 95%% confidence interval of every stat is within this")
+    parser.add_argument("--max-replicas", type=int, default=1000, help="Most replicas to run with --ci-target")
+    args = cli.parse_args(parser, experiments, list(experiments))
+    if args.ci_target is None:
+        StatData.header()
+    else:
+        ci_header()
+    for name in args.experiments:
+        experiments[name](args)
@@ -10,12 +10,18 @@
 #
 # The goal of this code is to demonstrate the overall technique, and show how simple it can be to write your
 # own event-based simulators. I intentionally don't use any libraries or frameworks here, although they can
-# be useful. This code also isn't tuned for performance, 
+# be useful. The event loop itself lives in `simlib/engine.py`, so it can be shared with the other simulators.
 
+import math
 import random
-import heapq
+from collections import defaultdict, deque
 from enum import Enum
 
+from simlib import cli, engine
+from simlib.rng import Streams
+from simlib.sketch import DDSketch
+from simlib.sweep import run_sweep
+
 # The arithmetic mean of the numbers in `l`
 def avg(l):
     return sum(l)/float(len(l))
@@ -35,141 +41,418 @@ class SkiierState(Enum):
     RIDING_LIFT = 2
     SKIING = 3
 
+# `StateCounts` keeps the number of skiiers in each state. Skiiers update it on every transition, so the stats can read
+#  the counts in O(1) instead of looking at every skiier.
+class StateCounts(object):
+    def __init__(self):
+        self.waiting = 0
+        self.riding_lift = 0
+        self.skiing = 0
+
 # The `Skiier` class models each skiier in the simulation. A skiier has the following properties:
 #  `speed`: The speed they ski down the slope at (in meters per second)
 #  `lift`: A link back to the lift (and associated queue) they're going to ride when done skiing
 #  `slope_len_m`: The length of the slope they're going to ski down (in meters)
+#  `counts`: The `StateCounts` shared by all the skiiers
+#  `lane`: The skiier's class of service (see `Lanes`), as an index with 0 the highest priority, or `None` for no class
+# Skiiers start in the lift queue at time 0, and `joined_t` is when they last joined it.
 class Skiier(object):
-    def __init__(self, speed, lift, slope_len_m):
+    def __init__(self, speed, lift, slope_len_m, counts=None, lane=None):
         self.speed = speed
         self.lift = lift
         self.slope_len_m = slope_len_m
+        self.lane = lane
         self.state = SkiierState.WAITING
+        self.joined_t = 0.0
+        self.counts = counts if counts is not None else StateCounts()
+        self.counts.waiting += 1
 
     # Board the lift (after being in the queue)
     # Return an event for when this skiier will leave the lift
     def board_lift(self, t):
+        self.board(t)
+        return [(t + self.lift.ride_time(), self.leave_lift, None)]
+
+    # Get on a chair, without scheduling getting off, for lifts that unload their chairs themselves.
+    #  The time spent in the queue goes into the lift's wait time sketches.
+    def board(self, t):
         assert self.state == SkiierState.WAITING
         self.state = SkiierState.RIDING_LIFT
-        return [(t + self.lift.ride_time(), self.leave_lift, None)]
+        wait = t - self.joined_t
+        self.lift.waits.add(wait)
+        if self.lane is not None:
+            self.lift.lane_waits[self.lane].add(wait)
+        self.counts.waiting -= 1
+        self.counts.riding_lift += 1
     
     # Get off the lift at the end of the lift ride, and start skiing
     # Return an event for when this skiier will get back to the lift line
-    def leave_lift(self, _payload, t):
+    def leave_lift(self, t, _payload):
         assert self.state == SkiierState.RIDING_LIFT
         self.state = SkiierState.SKIING
+        self.counts.riding_lift -= 1
+        self.counts.skiing += 1
         time_spent_skiing = self.slope_len_m / self.speed
         return [(t + time_spent_skiing, self.join_queue, None)]
 
     # Join the queue on our associated lift
-    def join_queue(self, _payload, t):
+    def join_queue(self, t, _payload):
         assert self.state == SkiierState.SKIING
         self.state = SkiierState.WAITING
+        self.counts.skiing -= 1
+        self.counts.waiting += 1
+        self.joined_t = t
         self.lift.queue.append(self)
         return None
 
+# `Lanes` is a lift line split into priority lanes (classes of service), like a season pass lane next to the main
+#  line. Each lane is its own deque, and `shares` is the fraction of the seats on each chair kept for each lane, which
+#  must add up to at most 1. Seats a lane can't fill go to the other lanes, highest priority first. Fractions of seats
+#  carry over from chair to chair, so a lane with a share of 0.25 of a 6 seat chair gets 3 seats every 2 chairs. No
+#  chair ever carries more than `chair_width`.
+# It has the same `append`, `extend` and `len` as the deque it replaces, with skiiers going into the lane for their
+#  `lane`, and `take` fills the next chair.
+class Lanes(object):
+    def __init__(self, shares):
+        if sum(shares) > 1.0 + 1e-9:
+            raise ValueError("lane shares add up to %f, which is more than a whole chair"%(sum(shares)))
+        self.shares = shares
+        self.lanes = [deque() for share in shares]
+        self.credits = [0.0 for share in shares]
+
+    def __len__(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    def append(self, skiier):
+        self.lanes[skiier.lane].append(skiier)
+
+    def extend(self, skiiers):
+        for skiier in skiiers:
+            self.append(skiier)
+
+    # Take the riders for a chair with `chair_width` seats, from the front of each lane if `fifo`, else from the back
+    def take(self, chair_width, fifo):
+        riders = []
+        for i, lane in enumerate(self.lanes):
+            self.credits[i] += self.shares[i] * chair_width
+            seats = int(self.credits[i])
+            n = min(seats, len(lane), chair_width - len(riders))
+            # Seats the lane has skiiers for, but that didn't fit on this chair, carry over to the next chair. Seats
+            #  the lane has nobody for are given up.
+            self.credits[i] -= seats - (min(seats, len(lane)) - n)
+            for j in range(n):
+                riders.append(lane.popleft() if fifo else lane.pop())
+        for lane in self.lanes:
+            while len(riders) < chair_width and len(lane) > 0:
+                riders.append(lane.popleft() if fifo else lane.pop())
+        return riders
+
+# `Outages` is a schedule of times when a lift is stopped or running slow, for fault injection. Each interval is
+#  `(start, end, speed)`, where `speed` is the fraction of normal speed the lift runs at: 0 for stopped, or 0.5 for
+#  chairs arriving half as often. Intervals mustn't overlap.
+# Lifts only ever ask about the current time, which never goes backwards, so `at` keeps its place in the schedule
+#  instead of searching it.
+class Outages(object):
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals)
+        self.i = 0
+
+    # The speed of the lift at time `t`, and when that speed ends (`None` if the lift is running normally)
+    def at(self, t):
+        intervals = self.intervals
+        while self.i < len(intervals) and intervals[self.i][1] <= t:
+            self.i += 1
+        if self.i < len(intervals) and intervals[self.i][0] <= t:
+            start, end, speed = intervals[self.i]
+            return speed, end
+        return 1.0, None
+
 # `Lift` models a ski lift and its associated queue.
 # If you aren't familiar with chair lifts, start here: https://en.wikipedia.org/wiki/Chairlift
 # The lift has the following attributes:
 #  `ride_time` and `ride_time_stdev`: The mean and standard deviation of the time it takes to ride from boarding to departure
 #  `chair_width`: The maximum number of skiiers who board the lift as each chair comes into the station
 #  `chair_period`: How often chairs arrive (in seconds)
+#  `rng`: The random stream (see `simlib/rng.py`) that ride times are drawn from
+#  `fifo`: Whether skiiers board in the order they joined the queue, like a real lift line. If false, the most recent
+#    arrival boards first (LIFO), which was the original behaviour of this model.
+#  `lanes`: Optionally, the share of each chair for each priority lane, which splits the queue into `Lanes`
+#  `outages`: An optional `Outages` schedule of when the lift is stopped or slowed. While the lift is stopped, nobody
+#    boards. Skiiers already riding an independent `Lift` still get off on time, but on a `RingLift` they're stuck on
+#    their chairs until it starts again.
+# Every skiier's wait from joining the queue to boarding goes into `waits`, a streaming histogram (see
+#  `simlib/sketch.py`), so the wait percentiles cost constant memory however long the run. Skiiers with a class of
+#  service also go into `lane_waits[lane]`.
 class Lift(object):
-    def __init__(self, ride_time, ride_time_stdev, chair_width, chair_period):
+    def __init__(self, ride_time, ride_time_stdev, chair_width, chair_period, rng=random, fifo=True, outages=None, lanes=None):
+        self.rng = rng
         self.ride_time_mean = ride_time
         self.ride_time_stdev = ride_time_stdev
         self.chair_width = chair_width
         self.chair_period = chair_period
-        # The queue of skiiers waiting to board starts empty
-        self.queue = []
+        # The queue of skiiers waiting to board starts empty. A deque is O(1) at both ends, however long the line gets.
+        self.queue = deque() if lanes is None else Lanes(lanes)
+        self.lanes = lanes
+        self.fifo = fifo
+        self.outages = outages
+        self.waits = DDSketch()
+        self.lane_waits = defaultdict(DDSketch)
+
+    # Take the skiiers for the next chair off the queue
+    def take_chair(self):
+        queue = self.queue
+        if self.lanes is not None:
+            return queue.take(self.chair_width, self.fifo)
+        n = min(self.chair_width, len(queue))
+        if self.fifo:
+            return [queue.popleft() for i in range(n)]
+        return [queue.pop() for i in range(n)]
+
+    # When the chair after one arriving at `t` arrives, and whether the lift is running at `t`
+    def next_chair(self, t):
+        if self.outages is None:
+            return t + self.chair_period, True
+        speed, end = self.outages.at(t)
+        if speed <= 0.0:
+            return end, False
+        return t + self.chair_period / speed, True
 
     # A chair has arrived. Board a number of skiiers onto the arriving chair, and set up their associated
     #  departure events.
-    def dequeue_skiiers(self, _payload, t):
-        events = [(t + self.chair_period, self.dequeue_skiiers, None)]
-        for i in range(0, self.chair_width):
-            if len(self.queue) > 0:
-                skiier = self.queue.pop()
-                events.extend(skiier.board_lift(t))
+    def dequeue_skiiers(self, t, _payload):
+        next_t, running = self.next_chair(t)
+        events = [(next_t, self.dequeue_skiiers, None)]
+        if not running:
+            return events
+        for skiier in self.take_chair():
+            events.extend(skiier.board_lift(t))
         return events
 
     # Return a single sample of the ride time distribution.
     # In reality, ride times aren't normal, and are highly correlated between all riders currently on the chair lift.
     # In a future simulation, we may explore the effect that this has one the overall dynamics.
     def ride_time(self):
-        return random.normalvariate(self.ride_time_mean, self.ride_time_stdev)
+        return self.rng.normalvariate(self.ride_time_mean, self.ride_time_stdev)
+
+# `RingLift` is a faster model of a lift, where every chair is clamped to the same cable, so every ride takes the same
+#  time: `ride_time` rounded to a whole number of chair periods. The chairs in transit are a ring buffer, with one slot
+#  for each chair on the way up. Every chair period, the chair in the current slot gets to the top and unloads, and
+#  then the slot is filled by the next chair leaving the bottom. So each chair costs one event, however many skiiers
+#  are on it, rather than one event per skiier.
+# Because all chairs move together, `ride_time_stdev` isn't used.
+class RingLift(Lift):
+    def __init__(self, ride_time, ride_time_stdev, chair_width, chair_period, rng=random, fifo=True, outages=None, lanes=None):
+        super().__init__(ride_time, ride_time_stdev, chair_width, chair_period, rng, fifo, outages, lanes)
+        self.chairs = [[] for i in range(max(1, round(ride_time / chair_period)))]
+        self.slot = 0
+
+    def dequeue_skiiers(self, t, _payload):
+        next_t, running = self.next_chair(t)
+        events = [(next_t, self.dequeue_skiiers, None)]
+        if not running:
+            return events
+        slot = self.slot
+        for skiier in self.chairs[slot]:
+            events.extend(skiier.leave_lift(t, None))
+        riders = self.take_chair()
+        for skiier in riders:
+            skiier.board(t)
+        self.chairs[slot] = riders
+        self.slot = slot + 1 if slot + 1 < len(self.chairs) else 0
+        return events
+
+# Lift models that can be picked by name
+lift_types = {
+    "independent": Lift,
+    "ring": RingLift,
+}
 
 # `Stats` is a simple object which runs periodically and writes down the current queue length, percentage of skiiers
 #  currently skiing, and any other relevant information.
 # When each simulation loop is complete, this object is used to report the results.    
+# The number of skiiers skiing comes from the skiiers' `StateCounts`, `counts`, and the wait time percentiles from the
+#  lift's `waits`.
 class Stats(object):
-    def __init__(self, name, lift, skiiers, calc_every):
+    def __init__(self, name, lift, skiiers, calc_every, counts):
         self.lift = lift
         self.skiiers = skiiers
+        self.counts = counts
         self.name = name
         self.calc_every = calc_every
         self.queue_lengths = []
         self.skiiers_skiing = []
 
-    def calc_stats(self, _period, t):
+    def calc_stats(self, t, _period):
         self.queue_lengths.append(len(self.lift.queue))
-        n_skiiers_skiing = sum([ 1 if skiier.state == SkiierState.SKIING else 0 for skiier in self.skiiers])
-        self.skiiers_skiing.append(n_skiiers_skiing / float(len(self.skiiers)))
+        self.skiiers_skiing.append(self.counts.skiing / float(len(self.skiiers)))
         return [(t + self.calc_every, self.calc_stats, None)]
 
+    def row(self):
+        waits = self.lift.waits
+        return "%f,%f,%f,%f,%f,%f,%d,%s"%(avg(self.queue_lengths), avg(self.skiiers_skiing), waits.quantile(0.5),
+                                          waits.quantile(0.9), waits.quantile(0.99), waits.max, len(self.skiiers), self.name)
+
     def print(self):
-        print("%f,%f,%d,%s"%(avg(self.queue_lengths), avg(self.skiiers_skiing), len(self.skiiers), self.name))
+        print(self.row())
 
     def header():
-        print("avg_queue_len,skiiers_skiing,skiiers,name")
-
-# Run a single simulation.        
-def sim_loop(max_t, stats, lift):
-    t = 0.0
-    q = [(0.0, stats.calc_stats, None), (random.random(), lift.dequeue_skiiers, None)]
-    # This is the core simulation loop. Until we've reached the maximum simulation time, pull the next event off
-    #  from a heap of events, fire whichever callback is associated with that event, and add any events it generates
-    #  back to the heap.
-    while len(q) > 0 and t < max_t:
-        # Get the next event. Because `q` is a heap, we can just pop this off the front of the heap.
-        (t, call, payload) = heapq.heappop(q)
-        # Execute the callback associated with this event
-        new_events = call(payload, t)
-        # If the callback returned any follow-up events, add them to the event queue `q` and make sure its still a valid heap
-        if new_events is not None:
-            q.extend(new_events)
-            heapq.heapify(q)
+        print("avg_queue_len,skiiers_skiing,wait_p50,wait_p90,wait_p99,wait_max,skiiers,name")
 
-# Run a loop of simulations, for a range of parameters of interest.
-#  In this case, we want to hold the parameters of the resort fixed, and vary the number of skiiers and the size of each chair on the lift line
-def run_sims(max_t):
+# Run a single simulation. The first chair arrives at a random time in the first second, drawn from `rng`.
+def sim_loop(max_t, stats, lift, rng=random):
+    engine.sim_loop(max_t, [(0.0, stats.calc_stats, None), (rng.random(), lift.dequeue_skiiers, None)])
+
+# Set up one simulation, with `n_skiiers` skiiers and chairs that hold `chair_width` skiiers and arrive every
+#  `chair_period` seconds. Returns the stats, the lift, and the simulation's random streams.
+#  `lift_type` is the lift model to use, from `lift_types`, and `queue` is the boarding order, "fifo" or "lifo".
+#  `outages` is an optional list of `(start, end, speed)` intervals when the lift is stopped or slowed (see `Outages`).
+#  If `priority_fraction` is set, that fraction of the skiiers are in priority lane 0, and the rest in lane 1. `lanes`
+#  is the share of each chair for each lane (see `Lanes`), or `None` for everyone to wait in one line.
+def make_sim(chair_width, n_skiiers, lift_type="independent", queue="fifo", chair_period=7.0, outages=None,
+             priority_fraction=None, lanes=None):
     # Chair parameters. These are roughly modelled on Crystal Mountain's Forest Queen chair.
     lift_ride_time = 300.0
     lift_ride_time_stdev = 30
-    chair_period = 7.0
     slope_len_m = 3000.0
     # Skiier parameters. For now, these are just guesses. We could calibrate this will readl data (or even replace the statistical model with
     # one that samples from real measurements)
     mean_skiier_speed_mps = 5.0
     skiier_speed_stdev_mps = 1.0
 
+    name = "chair_%d_pack"%(chair_width)
+    # Each part of the model draws from its own random stream (see `simlib/rng.py`)
+    streams = Streams()
+    lift = lift_types[lift_type](lift_ride_time, lift_ride_time_stdev, chair_width, chair_period, streams.pooled("rides"), queue == "fifo",
+                                         Outages(outages) if outages else None, lanes)
+    # Each skiier is assigned a speed, using a normal distribution. In reality, skiier speed is unlikely to be normally distributed.
+    #  How could we calibrate this model?
+    speeds = streams.stream("speeds")
+    counts = StateCounts()
+    skiiers = [Skiier(speeds.normalvariate(mean_skiier_speed_mps, skiier_speed_stdev_mps), lift, slope_len_m, counts) for i in range(n_skiiers)]
+    if priority_fraction is not None:
+        # Spread the priority skiiers evenly through the others
+        for i, skiier in enumerate(skiiers):
+            skiier.lane = 0 if int((i + 1) * priority_fraction) > int(i * priority_fraction) else 1
+    # All the skiiers start off in the lift queue at the beginning of the day. Clearly that's not realistic, but they have to start somewhere
+    lift.queue.extend(skiiers)
+    stats = Stats(name, lift, skiiers, 1.0, counts)
+    return stats, lift, streams
+
+# Run one simulation (see `make_sim`), and return its CSV row
+def run_sim(chair_width, n_skiiers, max_t, lift_type="independent", queue="fifo"):
+    stats, lift, streams = make_sim(chair_width, n_skiiers, lift_type, queue)
+    sim_loop(max_t, stats, lift, streams.stream("chairs"))
+    return stats.row()
+
+# The numbers of skiiers every sweep runs, from a quiet day up to well past the lift's capacity
+skiier_counts = range(25, 1250, 50)
+
+# Run a loop of simulations, for a range of parameters of interest.
+#  In this case, we want to hold the parameters of the resort fixed, and vary the number of skiiers and the size of each chair on the lift line
+# Each simulation is independent, so they're run in parallel across `workers` processes (see `simlib/sweep.py`).
+def run_sims(max_t, workers=None, seed=None, lift_type="independent", queue="fifo"):
     Stats.header()
-    # Run the simulation for chairs that can hold 4 and 6 skiiers
-    for chair_width in [4, 6]:
-        name = "chair_%d_pack"%(chair_width)
-        # And then for a range of skiers in the system
-        for n_skiiers in range(25, 1250, 50):
-            lift = Lift(lift_ride_time, lift_ride_time_stdev, chair_width, chair_period)
-            # Each skiier is assigned a speed, using a normal distribution. In reality, skiier speed is unlikely to be normally distributed.
-            #  How could we calibrate this model?
-            skiiers = [Skiier(random.normalvariate(mean_skiier_speed_mps, skiier_speed_stdev_mps), lift, slope_len_m) for i in range(n_skiiers)]
-            # All the skiiers start off in the lift queue at the beginning of the day. Clearly that's not realistic, but they have to start somewhere
-            lift.queue = skiiers.copy()
-            stats = Stats(name, lift, skiiers, 1.0)
-            sim_loop(max_t, stats, lift)
-            stats.print()
+    # Run the simulation for chairs that can hold 4 and 6 skiiers, and then for a range of skiers in the system
+    cells = [(chair_width, n_skiiers, max_t, lift_type, queue) for chair_width in [4, 6] for n_skiiers in skiier_counts]
+    for row in run_sweep(run_sim, cells, workers, seed):
+        print(row)
+
+# `Recovery` measures how a lift recovers from an outage from `start` to `end`. It writes down the queue length when
+#  the outage starts, and the longest the queue gets, and then checks every `check_every` seconds after the outage
+#  until the queue has drained back to its length at the start. `drain_time` is how long that took after the outage
+#  ended, or NaN if it never drained before the end of the run.
+class Recovery(object):
+    def __init__(self, lift, start, end, check_every=1.0):
+        self.lift = lift
+        self.start = start
+        self.end = end
+        self.check_every = check_every
+        self.queue_at_start = 0
+        self.peak_queue = 0
+        self.drain_time = math.nan
+
+    def outage_started(self, t, _payload):
+        self.queue_at_start = len(self.lift.queue)
+        return [(t + self.check_every, self.check, None)]
+
+    def check(self, t, _payload):
+        queue_len = len(self.lift.queue)
+        self.peak_queue = max(self.peak_queue, queue_len)
+        if t >= self.end and queue_len <= self.queue_at_start:
+            self.drain_time = t - self.end
+            return None
+        return [(t + self.check_every, self.check, None)]
+
+    def events(self):
+        return [(self.start, self.outage_started, None)]
+
+# Run one simulation with a priority lane for `priority_fraction` of the skiiers, which gets `priority_share` of the
+#  seats on every chair (or no priority lane if `priority_share` is `None`). Returns a CSV row with the wait times of
+#  each class.
+def run_priority_sim(chair_width, n_skiiers, max_t, priority_fraction, priority_share, lift_type="independent", queue="fifo"):
+    lanes = None if priority_share is None else [priority_share, 1.0 - priority_share]
+    stats, lift, streams = make_sim(chair_width, n_skiiers, lift_type, queue, priority_fraction=priority_fraction, lanes=lanes)
+    sim_loop(max_t, stats, lift, streams.stream("chairs"))
+    name = "single_line" if priority_share is None else "priority_%.2f"%(priority_share)
+    rows = []
+    for lane, lane_name in enumerate(["priority", "general"]):
+        waits = lift.lane_waits[lane]
+        rows.append("%d,%d,%s,%d,%f,%f,%f,%f,%s"%(chair_width, n_skiiers, lane_name, waits.count, waits.quantile(0.5),
+                                                  waits.quantile(0.9), waits.quantile(0.99), waits.max, name))
+    return rows
+
+# Measure how much a priority lane costs everyone else: for 4 and 6 seat chairs, sweep the number of skiiers towards
+#  saturation, with no priority lane, and with priority lanes that get a quarter and a half of every chair.
+def run_priority_sims(max_t, priority_fraction, workers=None, seed=None, lift_type="independent", queue="fifo"):
+    print("chair_width,skiiers,lane,boardings,wait_p50,wait_p90,wait_p99,wait_max,name")
+    cells = [(chair_width, n_skiiers, max_t, priority_fraction, priority_share, lift_type, queue)
+             for chair_width in [4, 6] for priority_share in [None, 0.25, 0.5] for n_skiiers in skiier_counts]
+    for rows in run_sweep(run_priority_sim, cells, workers, seed):
+        for row in rows:
+            print(row)
 
-run_sims(50000.0)
+# Run one simulation with the lift stopped (or slowed to `speed`) from `outage_start` for `outage_len` seconds, and
+#  return a CSV row with how long the queue took to drain afterwards, and whether that met the `sla` (in seconds).
+def run_outage_sim(chair_width, chair_period, n_skiiers, max_t, outage_start, outage_len, speed, sla, lift_type="independent", queue="fifo"):
+    outage_end = outage_start + outage_len
+    stats, lift, streams = make_sim(chair_width, n_skiiers, lift_type, queue, chair_period, [(outage_start, outage_end, speed)])
+    recovery = Recovery(lift, outage_start, outage_end)
+    engine.sim_loop(max_t, [(0.0, stats.calc_stats, None), (streams.stream("chairs").random(), lift.dequeue_skiiers, None)]
+                    + recovery.events())
+    return "%d,%f,%d,%d,%d,%f,%d,%s"%(chair_width, chair_period, n_skiiers, recovery.queue_at_start, recovery.peak_queue,
+                                      recovery.drain_time, recovery.drain_time <= sla, stats.name)
 
+# Size the lift for outages: for each chair width and chair period, sweep the number of skiiers, and find how long
+#  each takes to recover from the same outage. The outage starts well after the morning rush from everybody starting
+#  in the queue has cleared.
+def run_outage_sims(max_t, outage_start, outage_len, speed, sla, workers=None, seed=None, lift_type="independent", queue="fifo"):
+    print("chair_width,chair_period,skiiers,queue_at_outage,peak_queue,drain_time,meets_sla,name")
+    cells = [(chair_width, chair_period, n_skiiers, max_t, outage_start, outage_len, speed, sla, lift_type, queue)
+             for chair_width in [4, 6] for chair_period in [5.0, 7.0] for n_skiiers in skiier_counts]
+    for row in run_sweep(run_outage_sim, cells, workers, seed):
+        print(row)
 
+experiments = {
+    "chair_sweep": lambda args: run_sims(args.max_t or 50000.0, args.workers, args.seed, args.lift, args.queue),
+    "outage": lambda args: run_outage_sims(args.max_t or 20000.0, args.outage_start, args.outage_len, args.outage_speed,
+                                           args.sla, args.workers, args.seed, args.lift, args.queue),
+    "priority": lambda args: run_priority_sims(args.max_t or 20000.0, args.priority_fraction, args.workers, args.seed,
+                                               args.lift, args.queue),
+}
 
+if __name__ == "__main__":
+    parser = cli.make_parser("Simulate skiiers waiting for, riding, and skiing down from a chair lift", experiments)
+    parser.add_argument("--lift", default="independent", choices=list(lift_types),
+                        help="Lift model: independent ride times for each skiier, or a ring of chairs on one cable (faster)")
+    parser.add_argument("--queue", default="fifo", choices=["fifo", "lifo"],
+                        help="Boarding order: first come first served, or last come first served")
+    parser.add_argument("--outage-start", type=float, default=10000.0, help="When the lift stops, for the outage experiment (seconds)")
+    parser.add_argument("--outage-len", type=float, default=900.0, help="How long the lift stops for (seconds)")
+    parser.add_argument("--outage-speed", type=float, default=0.0,
+                        help="Fraction of normal speed the lift runs at during the outage (0 for stopped)")
+    parser.add_argument("--sla", type=float, default=900.0, help="How soon after the outage the queue should have drained (seconds)")
+    parser.add_argument("--priority-fraction", type=float, default=0.1,
+                        help="Fraction of skiiers with priority passes, for the priority experiment")
+    args = cli.parse_args(parser, experiments, ["chair_sweep"])
+    for name in args.experiments:
+        experiments[name](args)